@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成與PDF流程的離線基準測試
+以假的Gemini模型（可設定延遲、抖動與錯誤率）取代 self.model，不需網路，結果以JSON輸出
+
+用法：
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --latency 0.5 --jitter 0.2 --error-rate 0.05 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import importlib.util
+import os
+import random
+import re
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('GEMINI_API_KEY', None)
+
+import resume_generator as rg
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGeminiModel:
+    """模擬Gemini模型：固定延遲加上隨機抖動，並依錯誤率拋出例外
+
+    JSON輸出依response_schema決定欄位，並可依drop_rate隨機省略區段，模擬不完整的結構化輸出。
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, drop_rate=0.0, char_latency=0.0):
+        self.latency = latency
+        self.char_latency = char_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self.response_chars = 0
+
+    def _next_delay(self):
+        self.calls += 1
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return None
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def _response_text(self, prompt, generation_config):
+        self.prompt_chars += len(prompt)
+        if generation_config and generation_config.get('response_mime_type') == 'application/json':
+            schema = generation_config.get('response_schema') or {'type': 'ARRAY'}
+            item_schema = schema.get('items', schema)
+            keys = list(item_schema.get('properties') or rg.SECTION_NAMES)
+            
+            def item():
+                return {key: f"{key}：模擬內容。" * 20 for key in keys if self.random.random() >= self.drop_rate}
+            
+            if item_schema.get('type') == 'STRING':
+                # 版本池提示：回傳「共N個元素」的字串陣列
+                match = re.search(r'共(\d+)個元素', prompt)
+                text = json.dumps([f"版本{i}：模擬內容。" * 20 for i in range(int(match.group(1)) if match else 1)],
+                                  ensure_ascii=False)
+            elif schema['type'] == 'ARRAY':
+                text = json.dumps([item() for _ in range(max(1, prompt.count('姓名：')))], ensure_ascii=False)
+            else:
+                text = json.dumps(item(), ensure_ascii=False)
+        elif '」段落' in prompt:
+            text = "模擬內容。" * 20
+        else:
+            text = "===".join(f"{name}：模擬內容。" * 20 for name in rg.SECTION_NAMES)
+        self.response_chars += len(text)
+        return text
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        delay = self._next_delay()
+        if delay is None:
+            raise RuntimeError('503 模擬的服務錯誤')
+        text = self._response_text(prompt, generation_config)
+        time.sleep(delay + len(text) * self.char_latency)
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt, generation_config=None, **kwargs):
+        delay = self._next_delay()
+        if delay is None:
+            raise RuntimeError('503 模擬的服務錯誤')
+        text = self._response_text(prompt, generation_config)
+        await asyncio.sleep(delay + len(text) * self.char_latency)
+        return FakeResponse(text)
+
+def peak_rss_bytes():
+    """目前程序與已結束子程序的最高常駐記憶體"""
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {'self': own, 'children': children}
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+def install_fake_model(args):
+    generator = rg.get_generator()
+    generator.model = FakeGeminiModel(
+        args.latency, args.jitter, args.error_rate, args.seed, args.drop_rate, args.char_latency
+    )
+    generator.model_name = 'fake-gemini'
+    generator.gemini_available = True
+    generator.response_cache = None  # 避免快取影響量測
+    generator.rate_limiter.rate = 0
+    return generator
+
+def bench_generate_document(generator, args):
+    """循序呼叫 generate_document 的吞吐量"""
+    params = {'job_type': 'software'}
+    start = time.perf_counter()
+    for _ in range(args.documents):
+        generator.generate_document('job_application', params)
+    elapsed = time.perf_counter() - start
+    return {'documents': args.documents, 'seconds': elapsed, 'documents_per_second': args.documents / elapsed}
+
+def bench_document_latency(generator, args):
+    """單份文件從請求到完成的時間：一次完整生成 vs 區段並行"""
+    results = {}
+    for mode, params in (('whole', {'section_parallel': False}), ('section_parallel', {'section_parallel': True})):
+        samples = []
+        for i in range(args.latency_samples):
+            # 每次使用不同的種子，避免命中回應快取
+            rng = random.Random(f'latency:{mode}:{i}')
+            start = time.perf_counter()
+            asyncio.run(generator.generate_document_async('job_application', params, rng))
+            samples.append(time.perf_counter() - start)
+        results[mode] = summarize(samples)
+    return results
+
+def bench_task_runner(args):
+    """透過背景任務流程（並行、批次）生成文件的吞吐量"""
+    results = {}
+    for batch_size in sorted({1, args.batch_size}):
+        task_id = f'bench_runner_{batch_size}'
+        rg.get_task_store().create_task(task_id, args.documents, document_type='job_application')
+        start = time.perf_counter()
+        asyncio.run(rg.run_generation_task(task_id, 'job_application', {}, args.documents, batch_size))
+        elapsed = time.perf_counter() - start
+        results[f'batch_{batch_size}'] = {
+            'documents': args.documents,
+            'seconds': elapsed,
+            'documents_per_second': args.documents / elapsed,
+            'status': rg.get_task_store().get_task(task_id)['status']
+        }
+        rg.get_task_store().delete_task(task_id)
+    return results
+
+def bench_section_pool(generator, args):
+    """同一公司與職位的一批文件：每份都生成願景區段 vs 從版本池抽選（量測輸出字元數與時間）"""
+    if args.pool_size <= 0:
+        return None
+    original_pool = generator.section_pool
+    results = {}
+    try:
+        for mode in ('without_pool', 'with_pool'):
+            generator.section_pool = (
+                rg.SectionPool(args.pool_size, rg.SECTION_POOL_MAX_BYTES) if mode == 'with_pool' else None
+            )
+            rngs = [random.Random(f'pool:{mode}:{i}') for i in range(args.documents)]
+            params = {'job_type': 'software', 'company_name': '基準測試股份有限公司'}
+            response_chars = generator.model.response_chars
+            start = time.perf_counter()
+            for offset in range(0, args.documents, args.batch_size):
+                batch = rngs[offset:offset + args.batch_size]
+                asyncio.run(generator.generate_documents_batch_async('job_application', params, len(batch), batch))
+            elapsed = time.perf_counter() - start
+            results[mode] = {
+                'documents': args.documents,
+                'seconds': elapsed,
+                'response_chars': generator.model.response_chars - response_chars
+            }
+    finally:
+        generator.section_pool = original_pool
+    return results
+
+def bench_generate_pdf(generator, args):
+    """單份PDF的生成時間"""
+    documents = [generator.generate_document('job_application', {}) for _ in range(args.pdf_samples)]
+    generator.render_pdf(documents[0])  # 預熱字體與樣式
+    samples = []
+    for document in documents:
+        start = time.perf_counter()
+        generator.render_pdf(document)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_download_all(generator, args):
+    """/download_all 產生ZIP的時間（不使用PDF快取）"""
+    app = rg.create_app()
+    client = app.test_client()
+    template = generator.generate_document('job_application', {})
+    results = {}
+    for size in args.zip_sizes:
+        task_id = f'bench_zip_{size}'
+        rg.get_task_store().create_task(task_id, size, document_type='job_application')
+        rg.get_task_store().set_documents(task_id, 0, [template] * size)
+        rg.get_task_store().update_task(task_id, status='completed')
+        rg.pdf_cache.clear()
+        
+        start = time.perf_counter()
+        response = client.get(f'/download_all/{task_id}')
+        body_size = sum(len(chunk) for chunk in response.response)
+        elapsed = time.perf_counter() - start
+        results[str(size)] = {'seconds': elapsed, 'zip_bytes': body_size, 'status': response.status_code}
+        rg.get_task_store().delete_task(task_id)
+    return results
+
+def bench_bulk(args):
+    """模板大量模式（NumPy向量化）的吞吐量，量測到序列化成NDJSON為止"""
+    if args.bulk_documents <= 0 or importlib.util.find_spec('numpy') is None:
+        return None
+    start = time.perf_counter()
+    output_bytes = 0
+    for line in rg.iter_bulk_chunks('job_application', {'job_type': 'software'}, args.bulk_documents,
+                                    rg.BULK_CHUNK_SIZE, args.seed):
+        output_bytes += len(line.encode('utf-8'))
+    elapsed = time.perf_counter() - start
+    return {
+        'documents': args.bulk_documents,
+        'seconds': elapsed,
+        'documents_per_second': args.bulk_documents / elapsed,
+        'output_bytes': output_bytes
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='AI履歷生成器離線基準測試')
+    parser.add_argument('--documents', type=int, default=50, help='生成文件的數量')
+    parser.add_argument('--batch-size', type=int, default=5, help='任務流程額外量測的批次大小')
+    parser.add_argument('--latency', type=float, default=0.05, help='假模型每次呼叫的平均延遲（秒）')
+    parser.add_argument('--jitter', type=float, default=0.02, help='延遲的隨機抖動（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='假模型呼叫失敗的機率')
+    parser.add_argument('--char-latency', type=float, default=0.0, help='假模型每輸出一個字元增加的延遲（秒），模擬延遲隨輸出長度增加')
+    parser.add_argument('--latency-samples', type=int, default=5, help='量測單份文件完成時間的樣本數')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='假模型JSON輸出中每個區段被省略的機率')
+    parser.add_argument('--pool-size', type=int, default=5, help='版本池比較測試的每個鍵版本數，0表示略過')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pdf-samples', type=int, default=20, help='量測PDF生成時間的樣本數')
+    parser.add_argument('--zip-sizes', type=int, nargs='+', default=[1, 10, 50, 500])
+    parser.add_argument('--bulk-documents', type=int, default=100000, help='模板大量模式生成的文件數，0表示略過')
+    parser.add_argument('--output', help='將結果寫入此JSON檔（預設輸出到stdout）')
+    args = parser.parse_args()
+    
+    # 量測期間的訊息（包含PDF子程序的輸出）一律改到stderr，stdout只輸出JSON結果
+    sys.stdout.flush()
+    report_stream = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    generator = install_fake_model(args)
+    report = {
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'config': vars(args),
+        'generate_document': bench_generate_document(generator, args),
+        'document_latency_seconds': bench_document_latency(generator, args),
+        'task_runner': bench_task_runner(args),
+        'section_pool': bench_section_pool(generator, args),
+        'generate_pdf_seconds': bench_generate_pdf(generator, args),
+        'download_all': bench_download_all(generator, args),
+        'bulk': bench_bulk(args),
+        'fake_model': {
+            'calls': generator.model.calls,
+            'errors': generator.model.errors,
+            'prompt_chars': generator.model.prompt_chars,
+            'response_chars': generator.model.response_chars
+        },
+        'peak_rss_bytes': peak_rss_bytes()
+    }
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        report_stream.write(output + '\n')
+    report_stream.close()
+
+if __name__ == '__main__':
+    main()
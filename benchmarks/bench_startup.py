@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+啟動時間基準測試
+在全新的Python程序中量測匯入、建立應用程式與第一個請求的耗時，輸出JSON
+
+用法：
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --ref HEAD~1   # 同時量測指定git版本作為比較
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子程序中執行：舊版在匯入時即建立 app，新版透過 create_app()
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import resume_generator
+t1 = time.perf_counter()
+app = resume_generator.create_app() if hasattr(resume_generator, 'create_app') else resume_generator.app
+t2 = time.perf_counter()
+response = app.test_client().get('/')
+t3 = time.perf_counter()
+print(json.dumps({
+    'import_seconds': t1 - t0,
+    'create_app_seconds': t2 - t1,
+    'first_request_seconds': t3 - t2,
+    'ready_seconds': t2 - t0,
+    'status': response.status_code
+}))
+'''
+
+def run_probe(directory):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', PYTHONWARNINGS='ignore')
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=directory, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def measure(directory, runs):
+    samples = [run_probe(directory) for _ in range(runs)]
+    summary = {}
+    for key in ('import_seconds', 'create_app_seconds', 'first_request_seconds', 'ready_seconds'):
+        values = [sample[key] for sample in samples]
+        summary[key] = {
+            'median': statistics.median(values),
+            'min': min(values),
+            'max': max(values)
+        }
+    summary['status'] = samples[-1]['status']
+    return summary
+
+def checkout_ref(ref, directory):
+    """將指定git版本的程式與模板寫入暫存目錄"""
+    os.makedirs(os.path.join(directory, 'templates'), exist_ok=True)
+    for path in ('resume_generator.py', 'templates/index.html'):
+        content = subprocess.run(
+            ['git', 'show', f'{ref}:{path}'], cwd=ROOT, capture_output=True, check=True
+        ).stdout
+        with open(os.path.join(directory, path), 'wb') as f:
+            f.write(content)
+
+def main():
+    parser = argparse.ArgumentParser(description='量測AI履歷生成器的啟動時間')
+    parser.add_argument('--runs', type=int, default=5, help='每個版本量測的次數')
+    parser.add_argument('--ref', help='另外量測的git版本（例如 HEAD~1）')
+    args = parser.parse_args()
+    
+    report = {'python': sys.version.split()[0], 'runs': args.runs, 'current': measure(ROOT, args.runs)}
+    
+    if args.ref:
+        with tempfile.TemporaryDirectory() as directory:
+            checkout_ref(args.ref, directory)
+            report[args.ref] = measure(directory, args.runs)
+    
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
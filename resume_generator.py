@@ -5,35 +5,1680 @@ AI履歷生成器 - 支援應徵資料與學習歷程
 使用Gemini API生成個人化內容
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Blueprint, render_template, request, jsonify, send_file, Response, stream_with_context
+import argparse
+import multiprocessing
 import random
 import os
+import sys
+import io
 import json
+import gzip
+import re
+import hashlib
+import importlib.util
+import sqlite3
+import shutil
+from collections import OrderedDict, deque
 import zipfile
-import tempfile
-from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_LEFT, TA_CENTER
+from urllib.parse import quote
 import threading
 import time
-import google.generativeai as genai
+import asyncio
+import bisect
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'ai_resume_generator_2024'
+# google.generativeai 與 ReportLab 載入較慢，改在第一次使用時才匯入以加快啟動
 
-# 存儲生成進度的全域變數
-generation_progress = {}
+bp = Blueprint('resume', __name__)
+
+# 生成任務設定（可透過環境變數調整）
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '16'))  # 所有任務合計同時進行的工作數（依任務輪流分派）
+GEMINI_RATE_LIMIT = float(os.getenv('GEMINI_RATE_LIMIT', '5'))  # 每秒允許的API請求數
+GEMINI_RATE_BURST = int(os.getenv('GEMINI_RATE_BURST', '5'))  # 允許的瞬間請求數
+ADAPTIVE_CONCURRENCY_INITIAL = int(os.getenv('ADAPTIVE_CONCURRENCY_INITIAL', '4'))  # 所有任務共用的API同時請求數（起始值）
+ADAPTIVE_CONCURRENCY_MIN = int(os.getenv('ADAPTIVE_CONCURRENCY_MIN', '1'))
+ADAPTIVE_CONCURRENCY_MAX = int(os.getenv('ADAPTIVE_CONCURRENCY_MAX', '32'))
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_DECREASE_FACTOR', '0.5'))  # 遇到429時視窗縮小的倍率
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '60'))  # 單次API請求的逾時秒數
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))  # 429/503等可重試錯誤的重試次數
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '0.5'))  # 指數退避的起始秒數
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '8'))  # 退避等待的上限秒數
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))  # 連續失敗幾次後斷路
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))  # 斷路後多久允許試探請求
+GEMINI_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', '1'))  # 每次API請求生成的文件數
+GEMINI_MAX_BATCH_SIZE = 10
+SECTION_PARALLEL = os.getenv('SECTION_PARALLEL', '0') == '1'  # 預設是否將八個區段拆成並行的小請求（可由請求覆寫）
+GEMINI_OUTPUT_FORMAT = os.getenv('GEMINI_OUTPUT_FORMAT', 'json')  # json（依結構描述輸出JSON）或 text（以===分隔的文字）
+SECTION_POOL_SIZE = int(os.getenv('SECTION_POOL_SIZE', '0'))  # 願景／學習動機區段每個公司或科系預先生成的版本數，0表示停用
+SECTION_POOL_TTL = float(os.getenv('SECTION_POOL_TTL', str(24 * 3600)))  # 版本池保留秒數（跨任務共用），0表示不過期
+SECTION_POOL_MAX_BYTES = 4 * 1024 * 1024
+POOLED_SECTIONS = ('vision',)  # 只取決於公司／職位或科系、可由多份文件共用的區段
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'  # 是否快取Gemini回應
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', str(24 * 3600)))  # 秒，0表示不過期
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH')  # 設定後會將快取保存到此SQLite檔案
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_DISK_MAX_BYTES', str(512 * 1024 * 1024)))  # 快取檔案中回應的位元組上限，0表示不限制
+RESPONSE_CACHE_GC_INTERVAL = 600  # 清除快取檔案中過期回應的間隔秒數
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(os.cpu_count() or 1)))  # 打包ZIP時平行生成PDF的程序數，1表示不使用程序池
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # 已產生PDF的快取容量，0表示停用
+TASK_STORE_BACKEND = os.getenv('TASK_STORE', 'memory')  # memory 或 sqlite（多個worker程序時使用）
+TASK_STORE_PATH = os.getenv('TASK_STORE_PATH', 'tasks.db')
+TASK_TTL = float(os.getenv('TASK_TTL', str(24 * 3600)))  # 任務保留秒數，超過後清除
+TASK_GC_INTERVAL = float(os.getenv('TASK_GC_INTERVAL', '600'))  # 清除過期任務的間隔秒數
+TASK_MEMORY_BUDGET = int(os.getenv('TASK_MEMORY_BUDGET', str(256 * 1024 * 1024)))  # 已完成任務可常駐記憶體的位元組數，0表示不限制
+TASK_SPILL_DIR = os.getenv('TASK_SPILL_DIR', 'task_spill')  # 超出記憶體預算時寫出的目錄
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE', 'inline')  # inline（網頁程序內執行）或 sqlite（由獨立worker程序執行）
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'jobs.db')
+JOB_QUEUE_MAX_BACKLOG = int(os.getenv('JOB_QUEUE_MAX_BACKLOG', '100'))  # 未完成任務數上限，超過時回應佇列已滿，0表示不限制
+JOB_LEASE_TIMEOUT = float(os.getenv('JOB_LEASE_TIMEOUT', '120'))  # worker超過此秒數未回報心跳時重新排入佇列
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))  # worker佇列為空時的輪詢間隔秒數
+JOB_MAX_ATTEMPTS = 3  # 同一任務因worker中斷而重新執行的次數上限
+JOB_WORKER_TASKS = int(os.getenv('JOB_WORKER_TASKS', '4'))  # 每個worker程序同時執行的任務數（共用事件迴圈與公平排程器）
+LAZY_DOCUMENTS = os.getenv('LAZY_DOCUMENTS', 'fallback')  # none / fallback / all：哪些文件只存種子、讀取時重新產生
+BULK_MAX_DOCUMENTS = int(os.getenv('BULK_MAX_DOCUMENTS', '1000000'))  # 模板大量模式單次請求的文件數上限
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '10000'))  # 模板大量模式每個串流區塊的文件數
+
+# 文件內容的區段名稱（依提示中的順序）
+SECTION_NAMES = [
+    'education', 'language_skills', 'experience', 'technical_skills',
+    'certificates', 'projects', 'personality', 'vision'
+]
+
+# 進度或文件更新時通知同一程序內的 /stream 連線（其他程序的更新以輪詢取得）
+progress_condition = threading.Condition()
+progress_version = 0
+SSE_POLL_SECONDS = 1
+SSE_KEEPALIVE_SECONDS = 15
+
+# 任務狀態：queued（等待排程）→ started → completed / error / cancelled
+ACTIVE_STATUSES = ('queued', 'started')
+CANCEL_POLL_SECONDS = 0.5  # 執行中的任務檢查是否已被取消的間隔
+FINISHED_WITH_DOCUMENTS = ('completed', 'cancelled')  # 可預覽與下載文件的狀態（取消的任務保留已完成的文件）
+MAX_TASK_PRIORITY = 10  # 優先權為每輪排程中連續取得的名額數
+
+def notify_progress():
+    """通知等待中的串流連線有新進度"""
+    global progress_version
+    with progress_condition:
+        progress_version += 1
+        progress_condition.notify_all()
+
+def wait_for_progress(seen_version, timeout):
+    """等待新的進度通知，回傳目前的版本號"""
+    with progress_condition:
+        if progress_version == seen_version:
+            progress_condition.wait(timeout=timeout)
+        return progress_version
+
+class Counter:
+    """計數器指標"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            if not self.values and not self.labelnames:
+                return [(self.name, (), 0)]
+            return [(self.name, labelvalues, value) for labelvalues, value in self.values.items()]
+
+class Gauge(Counter):
+    """可增可減的量測指標"""
+
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self.lock:
+            self.values[labelvalues] = value
+
+class Histogram(Counter):
+    """直方圖指標（累積分桶）"""
+
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        with self.lock:
+            entry = self.values.get(labelvalues)
+            if entry is None:
+                entry = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(labelvalues, list(entry[0]), entry[1], entry[2]) for labelvalues, entry in self.values.items()]
+        
+        samples = []
+        for labelvalues, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append((f'{self.name}_bucket', labelvalues + (('le', le),), cumulative))
+            samples.append((f'{self.name}_sum', labelvalues, total))
+            samples.append((f'{self.name}_count', labelvalues, count))
+        return samples
+
+class MetricsRegistry:
+    """程序內的指標集合，以Prometheus文字格式輸出"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelvalues, value in metric.samples():
+                labels = []
+                for i, labelvalue in enumerate(labelvalues):
+                    # 直方圖分桶的le以 (名稱, 值) 形式附加在最後
+                    label, labelvalue = labelvalue if isinstance(labelvalue, tuple) else (metric.labelnames[i], labelvalue)
+                    escaped = str(labelvalue).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                    labels.append(f'{label}="{escaped}"')
+                label_text = '{' + ','.join(labels) + '}' if labels else ''
+                lines.append(f'{name}{label_text} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.register(Histogram(
+    'resume_stage_duration_seconds', '各處理階段的耗時（秒）', ('stage',)
+))
+GEMINI_REQUESTS = metrics.register(Counter('resume_gemini_requests_total', '送出的Gemini API請求數'))
+GEMINI_ERRORS = metrics.register(Counter('resume_gemini_errors_total', 'Gemini API請求失敗數', ('error',)))
+FALLBACK_DOCUMENTS = metrics.register(Counter('resume_fallback_documents_total', '使用備用模板內容的文件數'))
+SECTION_REPAIRS = metrics.register(Counter(
+    'resume_section_repairs_total', '結構化輸出缺漏而單獨補請求的區段數', ('section',)
+))
+DOCUMENTS_GENERATED = metrics.register(Counter('resume_documents_generated_total', '已生成的文件數', ('document_type',)))
+GEMINI_RETRIES = metrics.register(Counter('resume_gemini_retries_total', '可重試錯誤後的重試次數'))
+BREAKER_REJECTIONS = metrics.register(Counter('resume_gemini_breaker_rejections_total', '斷路器開啟時直接改用備用內容的請求數'))
+BREAKER_STATE = metrics.register(Gauge('resume_gemini_breaker_state', '斷路器狀態（0=關閉、1=開啟、2=半開）'))
+CONCURRENCY_LIMIT = metrics.register(Gauge('resume_gemini_concurrency_limit', '自適應限流目前允許的API同時請求數'))
+GEMINI_IN_FLIGHT = metrics.register(Gauge('resume_gemini_in_flight', '進行中的API請求數'))
+TASKS_IN_FLIGHT = metrics.register(Gauge('resume_tasks_in_flight', '執行中的生成任務數'))
+QUEUE_DEPTH = metrics.register(Gauge('resume_generation_queue_depth', '等待可用名額的生成工作數'))
+JOB_BACKLOG = metrics.register(Gauge('resume_job_backlog', '任務佇列中尚未完成的任務數'))
+JOB_REJECTIONS = metrics.register(Counter('resume_job_rejections_total', '因佇列已滿而拒絕的任務數'))
+SECTION_POOL_REQUESTS = metrics.register(Counter(
+    'resume_section_pool_requests_total', '取用共用區段版本池的次數（hit=已有版本、generated=新生成）', ('result',)
+))
+
+# 目前執行中的 (TraceRecorder, 文件索引)，沒有追蹤時為None
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class TraceRecorder:
+    """收集任務的時間軸區段（monotonic時間），批次寫入任務存儲"""
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def add(self, name, start, end, doc_index=None, **args):
+        span = {'name': name, 'start': start, 'end': end, 'doc': doc_index}
+        if args:
+            span['args'] = args
+        with self.lock:
+            self.pending.append(span)
+
+    def flush(self):
+        with self.lock:
+            spans, self.pending = self.pending, []
+        if spans:
+            get_task_store().add_spans(self.task_id, spans)
+
+@contextmanager
+def trace_scope(recorder, doc_index=None):
+    """在此範圍內的處理階段都記錄到指定任務（與文件）的時間軸"""
+    token = current_trace.set((recorder, doc_index))
+    try:
+        yield recorder
+    finally:
+        current_trace.reset(token)
+
+@contextmanager
+def observe_stage(stage):
+    """記錄一個處理階段的耗時，有追蹤時一併寫入時間軸"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        end = time.monotonic()
+        STAGE_SECONDS.observe(end - start, stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace[0].add(stage, start, end, trace[1])
+
+# 可重試的API錯誤（限流、暫時無法服務、逾時）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'DeadlineExceeded', 'InternalServerError', 'TimeoutError'
+}
+
+def is_retryable_error(error):
+    """判斷API錯誤是否值得重試"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return re.match(r'\s*(429|50[0234])\b', str(error)) is not None
+
+OVERLOAD_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+
+def is_overload_error(error):
+    """判斷是否為配額或限流錯誤（429）"""
+    if getattr(error, 'code', None) == 429:
+        return True
+    if any(cls.__name__ in OVERLOAD_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return re.match(r'\s*429\b', str(error)) is not None
+
+class AdaptiveLimiter:
+    """AIMD自適應並行限制：成功時逐步放大視窗，遇到429時依倍率縮小
+
+    視窗確實用滿時才會放大（每用滿一個視窗約+1）；同一批在縮小前送出的請求
+    再回報429時不會重複縮小。同步與asyncio呼叫端可共用同一個限制器。
+    """
+
+    def __init__(self, initial, min_limit, max_limit, decrease_factor=0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.last_decrease_at = 0
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.async_waiters = deque()
+        CONCURRENCY_LIMIT.set(int(self.limit))
+
+    @property
+    def window(self):
+        return int(self.limit)
+
+    def _try_acquire(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            GEMINI_IN_FLIGHT.set(self.in_flight)
+            return True
+        return False
+
+    def _wake_waiters(self):
+        """通知等待中的呼叫端（需持有lock）"""
+        self.condition.notify_all()
+        available = int(self.limit) - self.in_flight
+        while available > 0 and self.async_waiters:
+            loop, future = self.async_waiters.popleft()
+            if future.done():
+                # 已取消的等待者不佔用名額
+                continue
+            loop.call_soon_threadsafe(_resolve_future, future)
+            available -= 1
+
+    def acquire(self):
+        """取得一個名額，回傳取得時間"""
+        with self.condition:
+            while not self._try_acquire():
+                self.condition.wait()
+        return time.monotonic()
+
+    async def acquire_async(self):
+        """非同步取得一個名額，回傳取得時間"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                if self._try_acquire():
+                    return time.monotonic()
+                future = loop.create_future()
+                entry = (loop, future)
+                self.async_waiters.append(entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self.lock:
+                    if entry in self.async_waiters:
+                        # 尚未被喚醒：只移除自己，不影響其他等待者
+                        self.async_waiters.remove(entry)
+                    else:
+                        # 被喚醒後才取消時，把名額讓給下一個等待者
+                        self._wake_waiters()
+                raise
+
+    def release(self, acquired_at, outcome):
+        """歸還名額並依結果調整視窗（outcome: success / overload / error）"""
+        with self.lock:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            GEMINI_IN_FLIGHT.set(self.in_flight)
+            if outcome == 'success' and saturated:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == 'overload' and acquired_at >= self.last_decrease_at:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease_at = time.monotonic()
+            CONCURRENCY_LIMIT.set(int(self.limit))
+            self._wake_waiters()
+
+    @contextmanager
+    def slot(self):
+        """同步呼叫的名額，依是否發生例外回報結果"""
+        acquired_at = self.acquire()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'success'
+        except Exception as e:
+            outcome = 'overload' if is_overload_error(e) else 'error'
+            raise
+        finally:
+            self.release(acquired_at, outcome)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """非同步呼叫的名額，依是否發生例外回報結果"""
+        acquired_at = await self.acquire_async()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'success'
+        except Exception as e:
+            outcome = 'overload' if is_overload_error(e) else 'error'
+            raise
+        finally:
+            self.release(acquired_at, outcome)
+
+def _resolve_future(future):
+    if not future.done():
+        future.set_result(None)
+
+class CircuitBreaker:
+    """斷路器：連續失敗達門檻後停止呼叫API，冷卻後只放行一個試探請求
+
+    試探請求超過probe_timeout秒仍未回報結果時，視為已放棄並允許新的試探請求。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold, reset_timeout, probe_timeout=None):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout if probe_timeout is not None else max(reset_timeout, 1)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.probe_started_at = 0
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_STATE.set(state)
+
+    def allow_request(self):
+        """是否允許呼叫API"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and self.probe_in_flight:
+                if time.monotonic() - self.probe_started_at >= self.probe_timeout:
+                    self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                self.probe_started_at = time.monotonic()
+                return True
+            return False
+
+    def abandon_probe(self):
+        """請求在回報結果前被取消時呼叫，讓下一個請求可以重新試探"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+                print("✅ Gemini API 已恢復，斷路器關閉")
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⚠️  Gemini API 連續失敗，斷路器開啟 {self.reset_timeout:g} 秒")
+                self._set_state(self.OPEN)
+                self.opened_at = time.monotonic()
+
+class LRUCache:
+    """具TTL與位元組容量上限的LRU快取（執行緒安全）"""
+
+    def __init__(self, max_bytes, ttl=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """取得快取值，不存在或已過期時回傳None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at and expires_at < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size, expires_at=None):
+        """寫入快取，超過容量時淘汰最久未使用的項目"""
+        if size > self.max_bytes:
+            return
+        if expires_at is None and self.ttl:
+            expires_at = time.time() + self.ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self.entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """快取統計"""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+class ResponseCache:
+    """Gemini回應快取：記憶體LRU，並可選擇保存到SQLite檔案（WAL模式）以便重啟後沿用
+
+    快取檔案定期在背景執行緒清除過期的回應；超過disk_max_bytes時從最早寫入的回應
+    開始刪除，刪到上限的九成為止。讀寫檔案會阻塞，asyncio呼叫端應在執行緒中呼叫get/set。
+    """
+
+    def __init__(self, max_bytes, ttl=0, path=None, disk_max_bytes=0, gc_interval=600):
+        self.memory = LRUCache(max_bytes, ttl)
+        self.ttl = ttl
+        self.path = path
+        self.disk_max_bytes = disk_max_bytes
+        self.gc_interval = gc_interval
+        self.hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.disk_bytes = 0
+        self.last_gc = time.monotonic()
+        self.gc_thread = None
+        if path:
+            db = self.connect()
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+            )
+            db.commit()
+            self.maybe_gc(force=True)
+
+    @property
+    def persistent(self):
+        return self.path is not None
+
+    def connect(self):
+        """每個執行緒使用各自的連線（多個程序可同時開啟同一個檔案）"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA busy_timeout=30000')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    @staticmethod
+    def make_key(prompt, model_name):
+        """以正規化後的提示與模型名稱計算快取鍵"""
+        normalized = re.sub(r'\s+', ' ', prompt).strip()
+        return hashlib.sha256(f"{model_name}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, prompt, model_name):
+        key = self.make_key(prompt, model_name)
+        value = self.memory.get(key)
+        if value is None and self.persistent:
+            row = self.connect().execute(
+                'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row and (not row[1] or row[1] >= time.time()):
+                value = row[0]
+                self.memory.set(key, value, len(value.encode('utf-8')), expires_at=row[1])
+        
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, prompt, model_name, value):
+        key = self.make_key(prompt, model_name)
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self.memory.set(key, value, len(value.encode('utf-8')), expires_at=expires_at)
+        if self.persistent:
+            db = self.connect()
+            db.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+            db.commit()
+            with self.lock:
+                # 取代既有的鍵時會多算，清除時會重新計算實際大小
+                self.disk_bytes += len(value.encode('utf-8'))
+            self.maybe_gc()
+
+    def maybe_gc(self, force=False):
+        """到了清除間隔或超過位元組上限時，在背景執行緒清除快取檔案"""
+        with self.lock:
+            if self.gc_thread is not None and self.gc_thread.is_alive():
+                return
+            over_budget = self.disk_max_bytes and self.disk_bytes > self.disk_max_bytes
+            if not (force or over_budget or time.monotonic() - self.last_gc >= self.gc_interval):
+                return
+            self.last_gc = time.monotonic()
+            self.gc_thread = threading.Thread(target=self.gc, daemon=True)
+            self.gc_thread.start()
+
+    def gc(self):
+        """刪除過期的回應，超過位元組上限時再刪除最早寫入的回應"""
+        db = self.connect()
+        db.execute('DELETE FROM response_cache WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),))
+        disk_bytes = db.execute(
+            'SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM response_cache'
+        ).fetchone()[0]
+        evictions = 0
+        if self.disk_max_bytes and disk_bytes > self.disk_max_bytes:
+            # INSERT OR REPLACE會給新的rowid，依rowid排序即為寫入順序
+            excess = disk_bytes - int(self.disk_max_bytes * 0.9)
+            freed, cutoff = 0, None
+            for rowid, size in db.execute(
+                'SELECT rowid, LENGTH(CAST(value AS BLOB)) FROM response_cache ORDER BY rowid'
+            ):
+                freed += size
+                cutoff = rowid
+                evictions += 1
+                if freed >= excess:
+                    break
+            if cutoff is not None:
+                db.execute('DELETE FROM response_cache WHERE rowid <= ?', (cutoff,))
+                disk_bytes -= freed
+        db.commit()
+        with self.lock:
+            self.disk_bytes = disk_bytes
+            self.disk_evictions += evictions
+
+    def durable_for(self, seconds):
+        """回應是否保證保存至少seconds秒（0表示永久）：需保存到檔案且不會比這更早過期"""
+        if not self.persistent or self.disk_max_bytes:
+            # 有位元組上限時，回應可能在過期前就被刪除
+            return False
+        return not self.ttl or (seconds > 0 and self.ttl >= seconds)
+
+    def stats(self):
+        """快取命中統計"""
+        with self.lock:
+            stats = {'hits': self.hits, 'misses': self.misses, 'persistent': self.persistent}
+            if self.persistent:
+                stats['disk'] = {
+                    'bytes': self.disk_bytes, 'max_bytes': self.disk_max_bytes, 'evictions': self.disk_evictions
+                }
+        stats['memory'] = self.memory.stats()
+        return stats
+
+class SectionPool:
+    """共用區段的版本池：同一個鍵（公司與職位、或科系）只生成一次，之後的文件從中抽選
+
+    保存在程序內的LRU快取，跨任務共用直到過期；同時有多份文件需要同一個鍵時只送出一次請求。
+    """
+
+    def __init__(self, size, max_bytes, ttl=0):
+        self.size = size
+        self.cache = LRUCache(max_bytes, ttl)
+        self.lock = threading.Lock()
+        self.key_locks = {}  # key -> [threading.Lock, 等待中的執行緒數]
+        self.pending = {}  # key -> 生成中的asyncio.Task
+
+    def put(self, key, variants):
+        self.cache.set(key, variants, sum(len(v.encode('utf-8')) for v in variants))
+
+    def load(self, key, generate):
+        """取得版本列表，尚未生成時呼叫generate()；生成失敗時回傳空列表且不快取"""
+        variants = self.cache.get(key)
+        if variants is not None:
+            SECTION_POOL_REQUESTS.inc('hit')
+            return variants
+        with self.lock:
+            # 鍵來自請求輸入，鎖只在有人等待時保留，否則每個出現過的鍵都會留下一把鎖
+            entry = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                variants = self.cache.get(key)
+                if variants is not None:
+                    SECTION_POOL_REQUESTS.inc('hit')
+                    return variants
+                SECTION_POOL_REQUESTS.inc('generated')
+                variants = generate()
+                if variants:
+                    self.put(key, variants)
+                return variants
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.key_locks[key]
+
+    async def load_async(self, key, generate):
+        """load的非同步版本；generate為回傳版本列表的協程函式"""
+        variants = self.cache.get(key)
+        if variants is not None:
+            SECTION_POOL_REQUESTS.inc('hit')
+            return variants
+        task = self.pending.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            SECTION_POOL_REQUESTS.inc('generated')
+            task = asyncio.ensure_future(self._generate_async(key, generate))
+            self.pending[key] = task
+        else:
+            SECTION_POOL_REQUESTS.inc('hit')
+        # 等待中的文件被取消時不取消共用的生成請求
+        return await asyncio.shield(task)
+
+    async def _generate_async(self, key, generate):
+        try:
+            variants = await generate()
+            if variants:
+                self.put(key, variants)
+            return variants
+        finally:
+            self.pending.pop(key, None)
+
+    def stats(self):
+        return dict(self.cache.stats(), size=self.size)
+
+def process_alive(pid):
+    """檢查程序是否仍在執行"""
+    if os.name == 'nt':
+        # Windows的os.kill會直接結束程序，改用OpenProcess查詢
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_spills(spill_dir):
+    """刪除已結束程序留在spill_dir的寫出檔（含舊版直接放在根目錄的檔案）"""
+    try:
+        entries = os.listdir(spill_dir)
+    except OSError:
+        return
+    for name in entries:
+        path = os.path.join(spill_dir, name)
+        if name.endswith('.jsonl.gz'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        elif name.isdigit() and int(name) != os.getpid() and not process_alive(int(name)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class InMemoryTaskStore:
+    """任務存儲：保存在目前程序的記憶體中
+
+    已完成任務的文件超過memory_budget時，最久未讀取的任務會寫出成壓縮的JSONL檔，
+    之後讀取時再自動載回。寫出檔放在spill_dir下以程序ID命名的子目錄，
+    記憶體中的任務不會跨程序保留，啟動時會刪除已結束程序留下的子目錄。
+    """
+
+    def __init__(self, ttl=0, gc_interval=600, memory_budget=0, spill_dir=None):
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self.last_gc = time.time()
+        self.memory_budget = memory_budget
+        self.spill_dir = os.path.join(spill_dir, str(os.getpid())) if spill_dir else None
+        self.tasks = {}
+        self.documents = {}
+        self.document_bytes = {}  # task_id -> 常駐文件的估計位元組數
+        self.lru = OrderedDict()  # 可寫出的已結束任務（完成或取消），依最近讀取排序
+        self.spilled = {}  # task_id -> 寫出檔案的位元組數
+        self.spans = {}  # task_id -> 時間軸區段
+        self.lock = threading.Lock()
+        if spill_dir:
+            remove_stale_spills(spill_dir)
+
+    def __contains__(self, task_id):
+        with self.lock:
+            return task_id in self.tasks
+
+    def create_task(self, task_id, total, **fields):
+        """建立任務"""
+        self.maybe_gc()
+        now = time.time()
+        task = {
+            'status': 'queued',
+            'progress': 0,
+            'total': total,
+            'message': '排隊中...',
+            'created_at': now,
+            'updated_at': now
+        }
+        task.update(fields)
+        with self.lock:
+            self._drop_documents(task_id)
+            self.tasks[task_id] = task
+            self.documents[task_id] = {}
+            self.document_bytes[task_id] = 0
+            self.spans[task_id] = []
+
+    def get_task(self, task_id):
+        """取得任務狀態（不含文件內容），不存在時回傳None"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update_task(self, task_id, expected_status=None, **fields):
+        """更新任務狀態欄位；指定expected_status時，只在目前狀態符合其中之一時更新
+
+        回傳是否有更新。
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            if expected_status is not None and task['status'] not in expected_status:
+                return False
+            task.update(fields, updated_at=time.time())
+            if fields.get('status') in FINISHED_WITH_DOCUMENTS and self.memory_budget:
+                self.lru[task_id] = True
+                self._enforce_budget()
+            return True
+
+    def set_documents(self, task_id, start, documents):
+        """從指定位置開始寫入文件"""
+        with self.lock:
+            stored = self._load_documents(task_id)
+            if stored is None:
+                return
+            for offset, document in enumerate(documents):
+                stored[start + offset] = document
+                self.document_bytes[task_id] += len(json.dumps(document, ensure_ascii=False).encode('utf-8'))
+
+    def get_document(self, task_id, index):
+        """取得單份文件，不存在時回傳None"""
+        with self.lock:
+            return (self._load_documents(task_id) or {}).get(index)
+
+    def iter_documents(self, task_id, exclude=()):
+        """依順序逐一回傳已完成的 (index, document)，略過exclude中的索引"""
+        with self.lock:
+            items = sorted(
+                (index, document) for index, document in (self._load_documents(task_id) or {}).items()
+                if index not in exclude
+            )
+        return iter(items)
+
+    def get_documents(self, task_id):
+        """依順序取得任務的所有文件"""
+        return [document for _, document in self.iter_documents(task_id)]
+
+    def add_spans(self, task_id, spans):
+        """加入時間軸區段"""
+        with self.lock:
+            if task_id in self.spans:
+                self.spans[task_id].extend(spans)
+
+    def get_spans(self, task_id):
+        """取得任務的時間軸區段"""
+        with self.lock:
+            return list(self.spans.get(task_id, []))
+
+    def delete_task(self, task_id):
+        with self.lock:
+            self.tasks.pop(task_id, None)
+            self.spans.pop(task_id, None)
+            self._drop_documents(task_id)
+
+    def _drop_documents(self, task_id):
+        self.documents.pop(task_id, None)
+        self.document_bytes.pop(task_id, None)
+        self.lru.pop(task_id, None)
+        if self.spilled.pop(task_id, None) is not None:
+            try:
+                os.remove(self._spill_path(task_id))
+            except OSError:
+                pass
+
+    def _spill_path(self, task_id):
+        return os.path.join(self.spill_dir, f'{task_id}.jsonl.gz')
+
+    def _load_documents(self, task_id):
+        """取得任務的文件字典，已寫出到磁碟時先載回記憶體"""
+        if task_id in self.spilled:
+            stored = {}
+            size = 0
+            with gzip.open(self._spill_path(task_id), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    stored[record['index']] = record['document']
+                    size += len(line.encode('utf-8'))
+            os.remove(self._spill_path(task_id))
+            del self.spilled[task_id]
+            self.documents[task_id] = stored
+            self.document_bytes[task_id] = size
+            self.lru[task_id] = True
+            self._enforce_budget(keep=task_id)
+        
+        if task_id in self.lru:
+            self.lru.move_to_end(task_id)
+        return self.documents.get(task_id)
+
+    def _enforce_budget(self, keep=None):
+        """常駐位元組超過預算時，將最久未讀取的已結束任務寫出到磁碟"""
+        if not self.memory_budget or not self.spill_dir:
+            return
+        for task_id in list(self.lru):
+            if self.resident_bytes() <= self.memory_budget:
+                break
+            if task_id != keep:
+                self._spill(task_id)
+
+    def _spill(self, task_id):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = self._spill_path(task_id)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for index, document in sorted(self.documents[task_id].items()):
+                f.write(json.dumps({'index': index, 'document': document}, ensure_ascii=False) + '\n')
+        self.spilled[task_id] = os.path.getsize(path)
+        self.documents[task_id] = None
+        self.document_bytes[task_id] = 0
+        del self.lru[task_id]
+
+    def resident_bytes(self):
+        return sum(self.document_bytes.values())
+
+    def stats(self):
+        """記憶體與磁碟使用統計"""
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'tasks': len(self.tasks),
+                'resident_bytes': self.resident_bytes(),
+                'stored_bytes': 0,
+                'spilled_bytes': sum(self.spilled.values()),
+                'spilled_tasks': len(self.spilled),
+                'memory_budget': self.memory_budget
+            }
+
+    def expired_task_ids(self, cutoff):
+        with self.lock:
+            return [task_id for task_id, task in self.tasks.items() if task['updated_at'] < cutoff]
+
+    def maybe_gc(self):
+        """距離上次清理超過gc_interval時清除過期任務"""
+        if self.ttl and time.time() - self.last_gc >= self.gc_interval:
+            self.gc()
+
+    def gc(self):
+        """清除超過TTL未更新的任務，回傳清除數量"""
+        self.last_gc = time.time()
+        if not self.ttl:
+            return 0
+        expired = self.expired_task_ids(time.time() - self.ttl)
+        for task_id in expired:
+            self.delete_task(task_id)
+        return len(expired)
+
+class SQLiteTaskStore(InMemoryTaskStore):
+    """任務存儲：SQLite（WAL模式），可由多個worker程序共用"""
+
+    TASK_COLUMNS = ('status', 'progress', 'total', 'message', 'created_at', 'updated_at')
+
+    def __init__(self, path, ttl=0, gc_interval=600):
+        super().__init__(ttl, gc_interval)
+        self.path = path
+        self.local = threading.local()
+        db = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                progress INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                extra TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at);
+            CREATE TABLE IF NOT EXISTS task_documents (
+                task_id TEXT NOT NULL,
+                doc_index INTEGER NOT NULL,
+                document TEXT NOT NULL,
+                PRIMARY KEY (task_id, doc_index)
+            );
+            CREATE TABLE IF NOT EXISTS task_spans (
+                task_id TEXT NOT NULL,
+                span TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS task_spans_task_id ON task_spans (task_id);
+        ''')
+        db.commit()
+
+    def connect(self):
+        """每個執行緒使用各自的連線"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA busy_timeout=30000')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def __contains__(self, task_id):
+        row = self.connect().execute('SELECT 1 FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return row is not None
+
+    def _split_fields(self, fields):
+        columns = {k: v for k, v in fields.items() if k in self.TASK_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in self.TASK_COLUMNS}
+        return columns, extra
+
+    def create_task(self, task_id, total, **fields):
+        self.maybe_gc()
+        now = time.time()
+        task = {'status': 'queued', 'progress': 0, 'total': total, 'message': '排隊中...',
+                'created_at': now, 'updated_at': now}
+        task.update(fields)
+        columns, extra = self._split_fields(task)
+        db = self.connect()
+        with db:
+            db.execute('DELETE FROM task_documents WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM task_spans WHERE task_id = ?', (task_id,))
+            db.execute(
+                'INSERT OR REPLACE INTO tasks (task_id, status, progress, total, message, created_at, updated_at, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (task_id, columns['status'], columns['progress'], columns['total'], columns['message'],
+                 columns['created_at'], columns['updated_at'], json.dumps(extra, ensure_ascii=False))
+            )
+
+    def get_task(self, task_id):
+        row = self.connect().execute(
+            'SELECT status, progress, total, message, created_at, updated_at, extra FROM tasks WHERE task_id = ?',
+            (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        task = json.loads(row[-1])
+        task.update(zip(self.TASK_COLUMNS, row[:-1]))
+        return task
+
+    def update_task(self, task_id, expected_status=None, **fields):
+        fields['updated_at'] = time.time()
+        columns, extra = self._split_fields(fields)
+        condition, condition_args = '', ()
+        if expected_status is not None:
+            condition = f" AND status IN ({', '.join('?' * len(expected_status))})"
+            condition_args = tuple(expected_status)
+        db = self.connect()
+        with db:
+            if extra:
+                row = db.execute('SELECT extra FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+                if row is None:
+                    return False
+                merged = json.loads(row[0])
+                merged.update(extra)
+                columns['extra'] = json.dumps(merged, ensure_ascii=False)
+            assignments = ', '.join(f'{column} = ?' for column in columns)
+            cursor = db.execute(
+                f'UPDATE tasks SET {assignments} WHERE task_id = ?{condition}',
+                (*columns.values(), task_id, *condition_args)
+            )
+            return cursor.rowcount > 0
+
+    def set_documents(self, task_id, start, documents):
+        db = self.connect()
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO task_documents (task_id, doc_index, document) VALUES (?, ?, ?)',
+                [(task_id, start + offset, json.dumps(document, ensure_ascii=False))
+                 for offset, document in enumerate(documents)]
+            )
+
+    def get_document(self, task_id, index):
+        row = self.connect().execute(
+            'SELECT document FROM task_documents WHERE task_id = ? AND doc_index = ?', (task_id, index)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_documents(self, task_id, exclude=()):
+        cursor = self.connect().execute(
+            'SELECT doc_index, document FROM task_documents WHERE task_id = ? ORDER BY doc_index', (task_id,)
+        )
+        for index, document in cursor:
+            if index not in exclude:
+                yield index, json.loads(document)
+
+    def add_spans(self, task_id, spans):
+        db = self.connect()
+        with db:
+            db.executemany(
+                'INSERT INTO task_spans (task_id, span) VALUES (?, ?)',
+                [(task_id, json.dumps(span, ensure_ascii=False)) for span in spans]
+            )
+
+    def get_spans(self, task_id):
+        rows = self.connect().execute(
+            'SELECT span FROM task_spans WHERE task_id = ? ORDER BY rowid', (task_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete_task(self, task_id):
+        db = self.connect()
+        with db:
+            db.execute('DELETE FROM task_spans WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM task_documents WHERE task_id = ?', (task_id,))
+            db.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+
+    def stats(self):
+        row = self.connect().execute(
+            'SELECT COUNT(*), (SELECT COALESCE(SUM(LENGTH(document)), 0) FROM task_documents) FROM tasks'
+        ).fetchone()
+        # 文件都在資料庫中，沒有記憶體預算與寫出；欄位與記憶體存儲一致
+        return {
+            'backend': 'sqlite',
+            'tasks': row[0],
+            'resident_bytes': 0,
+            'stored_bytes': row[1],
+            'spilled_bytes': 0,
+            'spilled_tasks': 0,
+            'memory_budget': 0
+        }
+
+    def expired_task_ids(self, cutoff):
+        rows = self.connect().execute('SELECT task_id FROM tasks WHERE updated_at < ?', (cutoff,)).fetchall()
+        return [row[0] for row in rows]
+
+def create_task_store(config=None):
+    """依設定建立任務存儲；config中的TASK_STORE_BACKEND等鍵優先於環境變數"""
+    config = config or {}
+    backends = (config.get('TASK_STORE_BACKEND', TASK_STORE_BACKEND), config.get('JOB_QUEUE_BACKEND', JOB_QUEUE_BACKEND))
+    if 'sqlite' in backends:
+        # 由獨立worker程序執行任務時，進度與文件需經由SQLite共用
+        return SQLiteTaskStore(config.get('TASK_STORE_PATH', TASK_STORE_PATH), TASK_TTL, TASK_GC_INTERVAL)
+    return InMemoryTaskStore(TASK_TTL, TASK_GC_INTERVAL, TASK_MEMORY_BUDGET, TASK_SPILL_DIR)
+
+# 存儲生成進度與文件（第一次使用時才建立，create_app的設定可指定後端）
+STORE_CONFIG_KEYS = ('TASK_STORE_BACKEND', 'TASK_STORE_PATH', 'JOB_QUEUE_BACKEND', 'JOB_QUEUE_PATH')
+_store_config = {}
+_task_store = None
+_task_store_lock = threading.Lock()
+
+def get_task_store():
+    """取得（必要時建立）共用的任務存儲"""
+    global _task_store
+    with _task_store_lock:
+        if _task_store is None:
+            _task_store = create_task_store(_store_config)
+        return _task_store
+
+class QueueFullError(Exception):
+    """未完成的任務數已達上限"""
+
+class InlineJobQueue:
+    """任務佇列：直接交由網頁程序的背景事件迴圈執行，並限制未完成的任務數"""
+
+    def __init__(self, max_backlog=0):
+        self.max_backlog = max_backlog
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def backlog(self):
+        return self.active
+
+    def enqueue(self, task_id, payload):
+        with self.lock:
+            if self.max_backlog and self.active >= self.max_backlog:
+                raise QueueFullError(self.active)
+            self.active += 1
+        future = asyncio.run_coroutine_threadsafe(run_generation_task(task_id, **payload), get_background_loop())
+        future.add_done_callback(self._task_done)
+
+    def _task_done(self, future):
+        with self.lock:
+            self.active -= 1
+
+    def stats(self):
+        return {'backend': 'inline', 'backlog': self.backlog(), 'max_backlog': self.max_backlog}
+
+class SQLiteJobQueue:
+    """持久化任務佇列（SQLite），由獨立的worker程序領取執行
+
+    worker執行期間定期更新心跳；超過租約時間未更新的任務視為worker已中斷，
+    重新排入佇列，重試JOB_MAX_ATTEMPTS次後標記為失敗。
+    """
+
+    def __init__(self, path, max_backlog=0, lease_timeout=120):
+        self.path = path
+        self.max_backlog = max_backlog
+        self.lease_timeout = lease_timeout
+        self.local = threading.local()
+        db = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                enqueued_at REAL NOT NULL,
+                heartbeat_at REAL,
+                finished_at REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id);
+        ''')
+        columns = {row[1] for row in db.execute('PRAGMA table_info(jobs)')}
+        if 'priority' not in columns:
+            # 舊版建立的佇列檔案沒有優先權欄位
+            db.execute('ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1')
+        db.execute('CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, job_id)')
+        db.commit()
+
+    def connect(self):
+        """每個執行緒使用各自的連線"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA busy_timeout=30000')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def backlog(self):
+        row = self.connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()
+        return row[0]
+
+    def enqueue(self, task_id, payload):
+        db = self.connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            backlog = self.backlog()
+            if self.max_backlog and backlog >= self.max_backlog:
+                raise QueueFullError(backlog)
+            db.execute(
+                "INSERT INTO jobs (task_id, payload, status, enqueued_at, priority) VALUES (?, ?, 'pending', ?, ?)",
+                (task_id, json.dumps(payload, ensure_ascii=False), time.time(), int(payload.get('priority', 1)))
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+    def claim(self, worker):
+        """領取優先權最高、其次最早排入的待處理任務，沒有任務時回傳None"""
+        db = self.connect()
+        now = time.time()
+        failed_task_ids = []
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            stale = db.execute(
+                "SELECT job_id, task_id, attempts FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                (now - self.lease_timeout,)
+            ).fetchall()
+            for job_id, task_id, attempts in stale:
+                if attempts >= JOB_MAX_ATTEMPTS:
+                    db.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE job_id = ?",
+                        (now, 'worker中斷次數過多', job_id)
+                    )
+                    failed_task_ids.append(task_id)
+                else:
+                    db.execute("UPDATE jobs SET status = 'pending', worker = NULL WHERE job_id = ?", (job_id,))
+            
+            row = db.execute(
+                "SELECT job_id, task_id, payload FROM jobs WHERE status = 'pending' "
+                "ORDER BY priority DESC, job_id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, heartbeat_at = ? "
+                    "WHERE job_id = ?",
+                    (worker, now, row[0])
+                )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        
+        for task_id in failed_task_ids:
+            get_task_store().update_task(task_id, status='error', message='任務執行中斷次數過多')
+        if row is None:
+            return None
+        return {'job_id': row[0], 'task_id': row[1], 'payload': json.loads(row[2])}
+
+    def heartbeat(self, job_id):
+        db = self.connect()
+        with db:
+            db.execute('UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?', (time.time(), job_id))
+
+    def finish(self, job_id, error=None):
+        db = self.connect()
+        with db:
+            db.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE job_id = ?',
+                ('failed' if error else 'done', time.time(), error, job_id)
+            )
+
+    def stats(self):
+        counts = dict(self.connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {
+            'backend': 'sqlite',
+            'backlog': counts.get('pending', 0) + counts.get('running', 0),
+            'max_backlog': self.max_backlog,
+            'jobs': counts
+        }
+
+def create_job_queue(config=None):
+    """依設定建立任務佇列；config中的JOB_QUEUE_BACKEND等鍵優先於環境變數"""
+    config = config or {}
+    if config.get('JOB_QUEUE_BACKEND', JOB_QUEUE_BACKEND) == 'sqlite':
+        return SQLiteJobQueue(config.get('JOB_QUEUE_PATH', JOB_QUEUE_PATH), JOB_QUEUE_MAX_BACKLOG, JOB_LEASE_TIMEOUT)
+    return InlineJobQueue(JOB_QUEUE_MAX_BACKLOG)
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """取得（必要時建立）共用的任務佇列"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = create_job_queue(_store_config)
+        return _job_queue
+
+def configure_stores(config):
+    """以應用程式設定中的STORE_CONFIG_KEYS取代環境變數，之後的存儲與佇列依此重新建立"""
+    global _task_store, _job_queue
+    overrides = {key: config[key] for key in STORE_CONFIG_KEYS if key in config}
+    if not overrides:
+        return
+    with _task_store_lock, _job_queue_lock:
+        _store_config.update(overrides)
+        _task_store = None
+        _job_queue = None
+
+# 所有生成任務共用的背景事件迴圈
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+def get_background_loop():
+    """取得（必要時啟動）背景事件迴圈"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='generation-loop')
+            thread.daemon = True
+            thread.start()
+            _background_loop = loop
+        return _background_loop
+
+class TokenBucket:
+    """令牌桶限流器（執行緒安全）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _try_take(self):
+        """嘗試取得令牌，成功回傳0，否則回傳需等待的秒數"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """取得一個令牌，不足時等待補充"""
+        if self.rate <= 0:
+            return
+        while True:
+            wait_time = self._try_take()
+            if not wait_time:
+                return
+            time.sleep(wait_time)
+
+    async def acquire_async(self):
+        """非同步版本的acquire，等待時不佔用事件迴圈"""
+        if self.rate <= 0:
+            return
+        while True:
+            wait_time = self._try_take()
+            if not wait_time:
+                return
+            await asyncio.sleep(wait_time)
+
+class PDFRenderContext:
+    """PDF生成共用資源：中文字體與段落樣式
+
+    字體只在程序中註冊一次，解析後的字型資料（字符表、字寬）由ReportLab保存在
+    已註冊的字體物件中，供之後每次生成共用；樣式在字體載入後建立一次並重複使用。
+    """
+
+    FONT_NAME = 'ChineseFont'
+    FONT_PATHS = [
+        'NotoSansCJK-Regular.ttc',
+        'NotoSansTC-Regular.otf',
+        'TaipeiSansTCBeta-Regular.ttf',
+        '/System/Library/Fonts/PingFang.ttc',
+        'C:/Windows/Fonts/msjh.ttc',
+    ]
 
-class AIResumeGenerator:
     def __init__(self):
-        """初始化AI履歷生成器"""
+        self.font_loaded = False
+        self.font_ready = threading.Event()
+        self.loading_started = False
+        self.styles = None
+        self.lock = threading.Lock()
+
+    def load_fonts_in_background(self):
+        """在背景執行緒載入字體，避免啟動時等待解析大型字型檔"""
+        with self.lock:
+            if self.loading_started:
+                return
+            self.loading_started = True
+        thread = threading.Thread(target=self.load_fonts, name='font-loader')
+        thread.daemon = True
+        thread.start()
+
+    def load_fonts(self):
+        """載入中文字體"""
+        try:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            
+            for font_path in self.FONT_PATHS:
+                if os.path.exists(font_path):
+                    try:
+                        pdfmetrics.registerFont(TTFont(self.FONT_NAME, font_path))
+                        self.font_loaded = True
+                        print(f"成功載入字體: {font_path}")
+                        break
+                    except:
+                        continue
+                        
+        except Exception as e:
+            print(f"字體設定錯誤: {e}")
+        finally:
+            self.font_ready.set()
+
+    def wait_until_ready(self):
+        """等待字體載入完成（尚未開始時直接在目前執行緒載入）"""
+        with self.lock:
+            start_now = not self.loading_started
+            self.loading_started = True
+        if start_now:
+            self.load_fonts()
+        self.font_ready.wait()
+
+    def get_styles(self):
+        """取得PDF樣式，第一次呼叫時建立"""
+        if self.styles is not None:
+            return self.styles
+        
+        self.wait_until_ready()
+        with self.lock:
+            if self.styles is None:
+                self.styles = self.create_styles()
+        return self.styles
+
+    def create_styles(self):
+        """創建PDF樣式"""
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.enums import TA_CENTER
+        
+        styles = getSampleStyleSheet()
+        font_name = self.FONT_NAME if self.font_loaded else 'Helvetica'
+        
+        return {
+            'Title': ParagraphStyle(
+                'CustomTitle',
+                parent=styles['Heading1'],
+                fontSize=18,
+                spaceAfter=30,
+                alignment=TA_CENTER,
+                fontName=font_name
+            ),
+            'Heading': ParagraphStyle(
+                'CustomHeading',
+                parent=styles['Heading2'],
+                fontSize=14,
+                spaceAfter=12,
+                spaceBefore=12,
+                fontName=font_name
+            ),
+            'Normal': ParagraphStyle(
+                'CustomNormal',
+                parent=styles['Normal'],
+                fontSize=10,
+                spaceAfter=6,
+                fontName=font_name
+            )
+        }
+
+    def build_pdf(self, document_data, filename):
+        """依文件內容排版並寫出PDF"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        
+        doc = SimpleDocTemplate(filename, pagesize=A4)
+        styles = self.get_styles()
+        story = []
+        
+        basic_info = document_data['basic_info']
+        content = document_data['content']
+        document_type = document_data['document_type']
+        
+        # 標題
+        if document_type == 'job_application':
+            title = f"履歷表 - {basic_info['name']}"
+        else:
+            title = f"學習歷程檔案 - {basic_info['name']}"
+            
+        story.append(Paragraph(title, styles['Title']))
+        story.append(Spacer(1, 12))
+        
+        # 基本資訊
+        contact_info = [
+            f"聯絡資訊：{basic_info['email']} | {basic_info['phone']}",
+            f"居住地：{basic_info['city']} | 年齡：{basic_info['age']}歲"
+        ]
+        
+        for info in contact_info:
+            story.append(Paragraph(info, styles['Normal']))
+        
+        story.append(Spacer(1, 12))
+        
+        # 個人特質
+        story.append(Paragraph("個人特質", styles['Heading']))
+        traits_text = " | ".join([f"{k}: {v}" for k, v in document_data['personality_traits'].items()])
+        story.append(Paragraph(traits_text, styles['Normal']))
+        story.append(Spacer(1, 12))
+        
+        # 根據文件類型添加相應內容
+        if document_type == 'job_application':
+            sections = [
+                ('學歷背景', 'education'),
+                ('語言能力', 'language_skills'),
+                ('工作經驗', 'experience'),
+                ('專業技能', 'technical_skills'),
+                ('證照資格', 'certificates'),
+                ('專案經驗', 'projects'),
+                ('個人特質描述', 'personality'),
+                ('對公司願景', 'vision')
+            ]
+        else:  # student_portfolio
+            sections = [
+                ('學業表現', 'education'),
+                ('語言能力', 'language_skills'),
+                ('課外活動', 'experience'),
+                ('競賽經驗', 'technical_skills'),
+                ('志工服務', 'certificates'),
+                ('專題研究', 'projects'),
+                ('個人特質描述', 'personality'),
+                ('學習動機', 'vision')
+            ]
+        
+        for section_title, section_key in sections:
+            if section_key in content and content[section_key]:
+                story.append(Paragraph(section_title, styles['Heading']))
+                story.append(Paragraph(content[section_key], styles['Normal']))
+                story.append(Spacer(1, 12))
+        
+        doc.build(story)
+
+    def render(self, document_data):
+        """生成PDF並以bytes回傳"""
+        buffer = io.BytesIO()
+        with observe_stage('pdf'):
+            self.build_pdf(document_data, buffer)
+        return buffer.getvalue()
+
+_pdf_render_context = None
+_pdf_render_context_lock = threading.Lock()
+
+def get_pdf_render_context():
+    """取得程序共用的PDF生成資源"""
+    global _pdf_render_context
+    with _pdf_render_context_lock:
+        if _pdf_render_context is None:
+            _pdf_render_context = PDFRenderContext()
+        return _pdf_render_context
+
+class DocumentUnavailableError(Exception):
+    """只保存來源標記的AI文件已無法從回應快取重建"""
+
+def document_rng(seed, index):
+    """任務中第index份文件專用的亂數產生器（以字串作種子，不受PYTHONHASHSEED影響）"""
+    return random.Random(f'{seed}:{index}')
+
+class AIResumeGenerator:
+    def __init__(self, enable_gemini=True):
+        """初始化AI履歷生成器（enable_gemini=False時不呼叫Gemini，只使用模板內容）"""
         self.setup_fonts()
         self.init_data()
-        self.setup_gemini()
+        if enable_gemini:
+            self.setup_gemini()
+        else:
+            self.gemini_available = False
+        self.rate_limiter = TokenBucket(GEMINI_RATE_LIMIT, GEMINI_RATE_BURST)
+        self.circuit_breaker = CircuitBreaker(
+            BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, GEMINI_TIMEOUT + GEMINI_BACKOFF_MAX
+        )
+        self.concurrency_limiter = AdaptiveLimiter(
+            ADAPTIVE_CONCURRENCY_INITIAL, ADAPTIVE_CONCURRENCY_MIN, ADAPTIVE_CONCURRENCY_MAX, ADAPTIVE_DECREASE_FACTOR
+        )
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_PATH,
+                RESPONSE_CACHE_DISK_MAX_BYTES, RESPONSE_CACHE_GC_INTERVAL
+            )
+        self.section_pool = None
+        if SECTION_POOL_SIZE > 0:
+            self.section_pool = SectionPool(SECTION_POOL_SIZE, SECTION_POOL_MAX_BYTES, SECTION_POOL_TTL)
         
     def setup_gemini(self):
         """設定Gemini API"""
@@ -45,8 +1690,11 @@ class AIResumeGenerator:
             # 嘗試從環境變數讀取API Key
             api_key = os.getenv('GEMINI_API_KEY')
             if api_key:
+                import google.generativeai as genai
+                
                 genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
+                self.model_name = 'gemini-2.5-flash-preview-04-17'
+                self.model = genai.GenerativeModel(self.model_name)
                 self.gemini_available = True
                 print("✅ Gemini API 已成功連接")
             else:
@@ -58,29 +1706,9 @@ class AIResumeGenerator:
             self.gemini_available = False
     
     def setup_fonts(self):
-        """設定中文字體"""
-        try:
-            font_paths = [
-                'NotoSansCJK-Regular.ttc',
-                'NotoSansTC-Regular.otf',
-                'TaipeiSansTCBeta-Regular.ttf',
-                '/System/Library/Fonts/PingFang.ttc',
-                'C:/Windows/Fonts/msjh.ttc',
-            ]
-            
-            self.font_loaded = False
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                        self.font_loaded = True
-                        print(f"成功載入字體: {font_path}")
-                        break
-                    except:
-                        continue
-                        
-        except Exception as e:
-            print(f"字體設定錯誤: {e}")
+        """設定中文字體（於背景載入，首次生成PDF時才需等待）"""
+        self.pdf_context = get_pdf_render_context()
+        self.pdf_context.load_fonts_in_background()
     
     def init_data(self):
         """初始化資料庫"""
@@ -136,6 +1764,30 @@ class AIResumeGenerator:
             '問題解決': ['邏輯分析', '直覺判斷', '創意思考', '經驗導向', '數據導向', '人文關懷']
         }
         
+        # 各區段的內容說明（依SECTION_NAMES順序，供批次提示使用）
+        self.section_descriptions = {
+            'job_application': [
+                '學歷背景（包含大學名稱、科系、就讀時間、GPA）',
+                '語言能力（英文程度、相關測驗成績、其他語言）',
+                '工作經驗（公司名稱、職位、工作時間、工作內容描述）',
+                '專業技能（技術技能及熟練程度）',
+                '證照資格（相關專業證照）',
+                '專案經驗（專案名稱、描述、使用技術、團隊規模、擔任角色）',
+                '個人特質描述（基於提供的特質，寫一段個人特質說明）',
+                '對公司願景（對目標公司的看法和期待）'
+            ],
+            'student_portfolio': [
+                '學業表現（高中學校、主要科目成績、班級排名、特殊學術表現）',
+                '語言能力（英文程度、相關測驗成績、其他語言學習）',
+                '課外活動（社團參與、擔任幹部經驗、活動組織經驗）',
+                '競賽經驗（學科競賽、技能競賽、獲獎記錄）',
+                '志工服務（志工活動參與、服務時數、服務心得）',
+                '專題研究（研究主題、研究方法、研究成果、指導老師）',
+                '個人特質描述（基於提供的特質，寫一段個人特質說明）',
+                '學習動機（對目標科系的興趣和學習規劃）'
+            ]
+        }
+        
         self.companies = {
             'software': ['台積電', '聯發科技', '華碩電腦', '宏碁集團', '廣達電腦', '仁寶電腦',
                         '鴻海精密', '和碩聯合', '緯創資通', '英業達', '神通資科', '資策會',
@@ -149,50 +1801,175 @@ class AIResumeGenerator:
             'sales': ['台灣大哥大', '中華電信', '遠傳電信', '信義房屋', '永慶房屋']
         }
 
-    def generate_name(self):
-        return random.choice(self.names['surnames']) + random.choice(self.names['given_names'])
+    def generate_name(self, rng=random):
+        return rng.choice(self.names['surnames']) + rng.choice(self.names['given_names'])
 
-    def generate_basic_info(self, document_type):
-        """生成基本資訊"""
-        name = self.generate_name()
-        city = random.choice(self.cities)
+    def generate_basic_info(self, document_type, rng=random):
+        """生成基本資訊（rng可傳入random.Random以重現相同結果）"""
+        name = self.generate_name(rng)
+        city = rng.choice(self.cities)
         
         if document_type == 'job_application':
-            age = random.randint(22, 45)
+            age = rng.randint(22, 45)
         else:  # student_portfolio
-            age = random.randint(16, 19)
+            age = rng.randint(16, 19)
         
         return {
             'name': name,
             'city': city,
             'age': age,
             'email': f"{name.lower().replace(' ', '')}@email.com",
-            'phone': f'09{random.randint(10000000, 99999999)}'
+            'phone': f'09{rng.randint(10000000, 99999999)}'
         }
 
-    def select_personality_traits(self, custom_traits=None):
+    def select_personality_traits(self, custom_traits=None, rng=random):
         """選擇個人特質"""
         if custom_traits:
             return custom_traits
         
-        # 隨機選擇特質
-        selected_traits = {}
-        for category, traits in self.personality_traits.items():
-            selected_traits[category] = random.choice(traits)
+        # 隨機選擇特質
+        selected_traits = {}
+        for category, traits in self.personality_traits.items():
+            selected_traits[category] = rng.choice(traits)
+        
+        return selected_traits
+
+    def get_cached_response(self, prompt):
+        """查詢回應快取"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(prompt, getattr(self, 'model_name', ''))
+
+    def cache_response(self, prompt, text):
+        """寫入回應快取（空白回應不快取）"""
+        if self.response_cache is not None and text:
+            self.response_cache.set(prompt, getattr(self, 'model_name', ''), text)
+
+    async def get_cached_response_async(self, prompt):
+        """查詢回應快取；有快取檔案時在執行緒中讀取，不阻塞所有任務共用的事件迴圈"""
+        if self.response_cache is None or not self.response_cache.persistent:
+            return self.get_cached_response(prompt)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_cached_response, prompt)
+
+    async def cache_response_async(self, prompt, text):
+        """cache_response的非同步版本"""
+        if self.response_cache is None or not self.response_cache.persistent:
+            return self.cache_response(prompt, text)
+        await asyncio.get_running_loop().run_in_executor(None, self.cache_response, prompt, text)
+
+    def gemini_retry_delay(self, error, attempt):
+        """處理API錯誤並回傳重試前的等待秒數；不應重試時回傳None"""
+        GEMINI_ERRORS.inc(type(error).__name__)
+        if not is_retryable_error(error):
+            # 服務仍有回應（例如請求內容錯誤），不計入斷路器
+            self.circuit_breaker.record_success()
+            return None
+        
+        self.circuit_breaker.record_failure()
+        if attempt >= GEMINI_MAX_RETRIES or not self.circuit_breaker.allow_request():
+            return None
+        
+        GEMINI_RETRIES.inc()
+        # 指數退避加上完整隨機抖動
+        return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+
+    def generate_with_gemini(self, prompt, fallback_content="", generation_config=None, use_cache=True):
+        """使用Gemini API生成內容（可重試錯誤會退避後重試）
+
+        use_cache為False時不查詢也不寫入回應快取，用於每次都要重新抽樣的提示。
+        """
+        if not self.gemini_available:
+            return fallback_content
+        
+        cached = self.get_cached_response(prompt) if use_cache else None
+        if cached is not None:
+            return cached
+        
+        # 斷路器開啟時直接使用備用內容，不等待網路
+        if not self.circuit_breaker.allow_request():
+            BREAKER_REJECTIONS.inc()
+            return fallback_content
         
-        return selected_traits
+        attempt = 0
+        try:
+            while True:
+                try:
+                    with observe_stage('rate_limit'):
+                        self.rate_limiter.acquire()  # 避免API限制
+                    with self.concurrency_limiter.slot():
+                        GEMINI_REQUESTS.inc()
+                        with observe_stage('gemini'):
+                            response = self.model.generate_content(
+                                prompt, generation_config=generation_config,
+                                request_options={'timeout': GEMINI_TIMEOUT}
+                            )
+                        text = response.text
+                    self.circuit_breaker.record_success()
+                    if use_cache:
+                        self.cache_response(prompt, text)
+                    return text
+                except Exception as e:
+                    delay = self.gemini_retry_delay(e, attempt)
+                    if delay is None:
+                        print(f"Gemini API 調用失敗: {e}")
+                        return fallback_content
+                    print(f"Gemini API 暫時失敗，{delay:.1f} 秒後重試: {e}")
+                    with observe_stage('backoff'):
+                        time.sleep(delay)
+                    attempt += 1
+        except BaseException:
+            # 中斷時沒有成功或失敗的結果，不可讓試探請求一直佔著名額
+            self.circuit_breaker.abandon_probe()
+            raise
 
-    def generate_with_gemini(self, prompt, fallback_content=""):
-        """使用Gemini API生成內容"""
+    async def generate_with_gemini_async(self, prompt, fallback_content="", generation_config=None, use_cache=True):
+        """使用Gemini非同步API生成內容（可重試錯誤會退避後重試）"""
         if not self.gemini_available:
             return fallback_content
         
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            print(f"Gemini API 調用失敗: {e}")
+        cached = await self.get_cached_response_async(prompt) if use_cache else None
+        if cached is not None:
+            return cached
+        
+        # 斷路器開啟時直接使用備用內容，不等待網路
+        if not self.circuit_breaker.allow_request():
+            BREAKER_REJECTIONS.inc()
             return fallback_content
+        
+        attempt = 0
+        try:
+            while True:
+                try:
+                    with observe_stage('rate_limit'):
+                        await self.rate_limiter.acquire_async()  # 避免API限制
+                    async with self.concurrency_limiter.slot_async():
+                        GEMINI_REQUESTS.inc()
+                        with observe_stage('gemini'):
+                            response = await asyncio.wait_for(
+                                self.model.generate_content_async(
+                                    prompt, generation_config=generation_config,
+                                    request_options={'timeout': GEMINI_TIMEOUT}
+                                ),
+                                GEMINI_TIMEOUT
+                            )
+                        text = response.text
+                    self.circuit_breaker.record_success()
+                    if use_cache:
+                        await self.cache_response_async(prompt, text)
+                    return text
+                except Exception as e:
+                    delay = self.gemini_retry_delay(e, attempt)
+                    if delay is None:
+                        print(f"Gemini API 調用失敗: {e}")
+                        return fallback_content
+                    print(f"Gemini API 暫時失敗，{delay:.1f} 秒後重試: {e}")
+                    with observe_stage('backoff'):
+                        await asyncio.sleep(delay)
+                    attempt += 1
+        except BaseException:
+            # 被取消（/cancel、任務關閉）時沒有結果，不可讓試探請求一直佔著名額
+            self.circuit_breaker.abandon_probe()
+            raise
 
     def create_job_application_prompt(self, basic_info, job_type, company_name, personality_traits, education_level):
         """創建求職履歷的Gemini提示"""
@@ -270,29 +2047,372 @@ class AIResumeGenerator:
         sections = response_text.split('===')
         parsed_content = {}
         
-        section_names = [
-            'education', 'language_skills', 'experience', 'technical_skills',
-            'certificates', 'projects', 'personality', 'vision'
-        ]
-        
         for i, section in enumerate(sections):
-            if i < len(section_names) and section.strip():
-                parsed_content[section_names[i]] = section.strip()
+            if i < len(SECTION_NAMES) and section.strip():
+                parsed_content[SECTION_NAMES[i]] = section.strip()
         
         return parsed_content
 
-    def generate_fallback_content(self, document_type, job_type_or_major, basic_info, personality_traits):
+    def create_batch_prompt(self, prepared_list):
+        """創建一次生成多份文件的Gemini提示（要求JSON陣列輸出）"""
+        document_type = prepared_list[0]['document_type']
+        count = len(prepared_list)
+        
+        if document_type == 'job_application':
+            subject, document_name = '求職者', '履歷'
+            requirements = ['符合台灣就業環境', f"適合{prepared_list[0]['shared']['應徵職位']}職位"]
+        else:
+            subject, document_name = '學生', '學習歷程'
+            requirements = ['符合台灣高中生背景', '適合各自的目標科系申請', '展現學習熱忱和潛力']
+        
+        shared_lines = "\n".join(f"- {k}：{v}" for k, v in prepared_list[0]['shared'].items())
+        candidate_lines = "\n".join(
+            f"{i + 1}. " + "｜".join(f"{k}：{v}" for k, v in prepared['profile'].items())
+            for i, prepared in enumerate(prepared_list)
+        )
+        field_lines = "\n".join(
+            f"- {key}：{description}"
+            for key, description in zip(SECTION_NAMES, self.section_descriptions[document_type])
+            if key in prepared_list[0]['sections']
+        )
+        requirement_lines = "\n".join(
+            f"- {item}" for item in requirements + ['反映個人特質', '具有真實感和個人化', '每位之間內容不可重複', '使用繁體中文']
+        )
+        
+        prompt = f"""
+請為以下{count}位{subject}分別生成一份完整的中文{document_name}內容。
+
+共同條件：
+{shared_lines or '- 無'}
+
+{subject}名單：
+{candidate_lines}
+
+請以JSON陣列回覆，依名單順序包含{count}個物件，每個物件包含以下欄位（值皆為字串）：
+{field_lines}
+
+請確保內容：
+{requirement_lines}
+"""
+        return prompt
+
+    def parse_structured_response(self, response_text, count, sections=SECTION_NAMES):
+        """一次解析JSON回應，回傳長度為count的內容列表，每項只保留有值的區段（可能不完整）"""
+        results = [{} for _ in range(count)]
+        text = (response_text or '').strip()
+        # 去除可能包住JSON的程式碼區塊標記
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text)
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return results
+        
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list):
+            return results
+        
+        for i, item in enumerate(items[:count]):
+            if isinstance(item, dict):
+                results[i] = {
+                    key: str(item[key]).strip()
+                    for key in sections
+                    if item.get(key) and str(item[key]).strip()
+                }
+        
+        return results
+
+    def pool_key(self, prepared):
+        """共用區段版本池的鍵：求職履歷依（公司, 職位），學習歷程依科系"""
+        if prepared['document_type'] == 'job_application':
+            return ('job_application', prepared['shared']['目標公司'], prepared['shared']['應徵職位'])
+        return ('student_portfolio', prepared['profile']['目標科系'])
+
+    def create_pool_prompt(self, prepared, size):
+        """創建一次生成多個共用區段版本的提示（不含個人資料，供同一公司或科系的文件共用）"""
+        description = dict(zip(SECTION_NAMES, self.section_descriptions[prepared['document_type']]))['vision']
+        if prepared['document_type'] == 'job_application':
+            subject = f"應徵「{prepared['shared']['目標公司']}」{prepared['shared']['應徵職位']}職位的求職者"
+        else:
+            subject = f"申請「{prepared['profile']['目標科系']}」的高中生"
+        
+        prompt = f"""
+請為{subject}撰寫{size}個不同版本的「{description.split('（')[0]}」段落。
+
+段落內容：{description}
+
+各版本的觀點、重點與用語需明顯不同；不要提及姓名或其他個人資料，讓不同的人都能使用；使用繁體中文。
+請以JSON字串陣列回覆，共{size}個元素。
+"""
+        return prompt
+
+    def parse_pool_response(self, response_text):
+        """解析版本池的JSON字串陣列，只保留非空白的版本"""
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', (response_text or '').strip())
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return []
+        if not isinstance(items, list):
+            return []
+        return [str(item).strip() for item in items if isinstance(item, str) and item.strip()]
+
+    def pool_config(self):
+        return {'response_mime_type': 'application/json', 'response_schema': {'type': 'ARRAY', 'items': {'type': 'STRING'}}}
+
+    def attach_pools(self, prepared_list, pools):
+        """整批文件都取得版本池時，才將共用區段從提示中移除（批次提示的欄位需一致）"""
+        if not all(pools):
+            return
+        for prepared, variants in zip(prepared_list, pools):
+            prepared['pooled'] = {key: variants for key in POOLED_SECTIONS}
+            prepared['sections'] = [key for key in SECTION_NAMES if key not in POOLED_SECTIONS]
+
+    def load_pools(self, prepared_list):
+        """為這批文件取得共用區段的版本池（同步版本）"""
+        if self.section_pool is None:
+            return
+        size = self.section_pool.size
+        pools = [
+            self.section_pool.load(self.pool_key(prepared), lambda prepared=prepared: self.parse_pool_response(
+                self.generate_with_gemini(
+                    self.timed_prompt(self.create_pool_prompt, prepared, size), generation_config=self.pool_config(),
+                    use_cache=False  # 版本池過期後要重新抽樣，不可取回快取中相同的版本
+                )
+            ))
+            for prepared in prepared_list
+        ]
+        self.attach_pools(prepared_list, pools)
+
+    async def load_pools_async(self, prepared_list):
+        """為這批文件取得共用區段的版本池；不同的鍵同時請求"""
+        if self.section_pool is None:
+            return
+        size = self.section_pool.size
+        
+        def generate(prepared):
+            async def run():
+                return self.parse_pool_response(await self.generate_with_gemini_async(
+                    self.timed_prompt(self.create_pool_prompt, prepared, size), generation_config=self.pool_config(),
+                    use_cache=False  # 版本池過期後要重新抽樣，不可取回快取中相同的版本
+                ))
+            return run
+        
+        pools = await asyncio.gather(*(
+            self.section_pool.load_async(self.pool_key(prepared), generate(prepared)) for prepared in prepared_list
+        ))
+        self.attach_pools(prepared_list, pools)
+
+    def parse_batch_response(self, response_text, count):
+        """解析批次JSON回應，回傳長度為count的內容列表（不完整的項目為None）"""
+        return [
+            content if self.validate_content(content) else None
+            for content in self.parse_structured_response(response_text, count)
+        ]
+
+    def structured_config(self, sections=SECTION_NAMES, count=None):
+        """要求依結構描述輸出JSON的generation_config；指定count時為物件陣列"""
+        schema = {
+            'type': 'OBJECT',
+            'properties': {key: {'type': 'STRING'} for key in sections},
+            'required': list(sections)
+        }
+        if count is not None:
+            schema = {'type': 'ARRAY', 'items': schema}
+        return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+    def profile_lines(self, prepared):
+        """單份文件的精簡基本資料，供區段層級的提示共用"""
+        return "\n".join(f"- {k}：{v}" for k, v in dict(prepared['shared'], **prepared['profile']).items())
+
+    def create_repair_prompt(self, prepared, partial, missing):
+        """創建只補上缺漏區段的提示，已完成的區段僅節錄供保持一致"""
+        document_name = '履歷' if prepared['document_type'] == 'job_application' else '學習歷程'
+        descriptions = dict(zip(SECTION_NAMES, self.section_descriptions[prepared['document_type']]))
+        info_lines = self.profile_lines(prepared)
+        existing_lines = "\n".join(
+            f"- {key}：{value[:80]}" for key, value in partial.items()
+        )
+        field_lines = "\n".join(f"- {key}：{descriptions[key]}" for key in missing)
+        
+        prompt = f"""
+以下{document_name}缺少部分區段，請只生成缺少的區段。
+
+基本資料：
+{info_lines}
+
+已完成的區段（節錄，請保持內容一致）：
+{existing_lines}
+
+請以JSON物件回覆，只包含以下欄位（值皆為字串，使用繁體中文）：
+{field_lines}
+"""
+        return prompt
+
+    def create_section_prompt(self, prepared, section):
+        """創建只生成單一區段的提示（區段並行模式）"""
+        description = dict(zip(SECTION_NAMES, self.section_descriptions[prepared['document_type']]))[section]
+        if prepared['document_type'] == 'job_application':
+            subject, document_name = '求職者', '履歷'
+            requirement = f"符合台灣就業環境、適合{prepared['shared']['應徵職位']}職位"
+        else:
+            subject, document_name = '學生', '學習歷程'
+            requirement = '符合台灣高中生背景、展現學習熱忱'
+        
+        prompt = f"""
+請為以下{subject}撰寫{document_name}中的「{description.split('（')[0]}」段落。
+
+基本資料：
+{self.profile_lines(prepared)}
+
+段落內容：{description}
+
+請直接輸出這個段落的內容，不要加標題或其他段落；內容需{requirement}、反映個人特質、具有真實感，使用繁體中文。
+"""
+        return prompt
+
+    def sections_to_document(self, prepared, responses):
+        """合併各區段的回應，失敗的區段以備用內容補上"""
+        content = {key: text.strip() for key, text in zip(prepared['sections'], responses) if text and text.strip()}
+        if not content:
+            return self.finish_document(prepared)
+        missing = [key for key in prepared['sections'] if not content.get(key)]
+        if missing:
+            return self.merge_repaired_sections(prepared, content, missing, None)
+        return self.finish_document(prepared, content=content)
+
+    def generate_sections(self, prepared):
+        """以並行的小請求分別生成八個區段（同步版本使用執行緒）"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with observe_stage('prompt'):
+            prompts = [self.create_section_prompt(prepared, key) for key in prepared['sections']]
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            responses = list(executor.map(self.generate_with_gemini, prompts))
+        return self.sections_to_document(prepared, responses)
+
+    async def generate_sections_async(self, prepared):
+        """以並行的小請求分別生成八個區段，再合併成文件內容"""
+        with observe_stage('prompt'):
+            prompts = [self.create_section_prompt(prepared, key) for key in prepared['sections']]
+        responses = await asyncio.gather(*(self.generate_with_gemini_async(prompt) for prompt in prompts))
+        return self.sections_to_document(prepared, responses)
+
+    def merge_repaired_sections(self, prepared, partial, missing, response):
+        """合併補請求的區段，仍缺漏的區段以備用內容補上"""
+        content = dict(partial)
+        if response:
+            with observe_stage('parse'):
+                repaired = self.parse_structured_response(response, 1, missing)[0]
+            content.update(repaired)
+        
+        still_missing = [key for key in prepared['sections'] if not content.get(key)]
+        if still_missing:
+            fallback = self.fallback_for(prepared)
+            content.update({key: fallback[key] for key in still_missing})
+        
+        document = self.finish_document(prepared, content=content)
+        document['repaired_sections'] = missing
+        return document
+
+    def complete_document(self, prepared, partial):
+        """以結構化回應組合文件：完整時直接使用，缺漏時只補請求缺少的區段"""
+        if self.validate_content(partial, prepared['sections']):
+            return self.finish_document(prepared, content=partial)
+        if not partial:
+            return self.finish_document(prepared)
+        
+        missing = [key for key in prepared['sections'] if not partial.get(key)]
+        for key in missing:
+            SECTION_REPAIRS.inc(key)
+        response = self.generate_with_gemini(
+            self.timed_prompt(self.create_repair_prompt, prepared, partial, missing),
+            generation_config=self.structured_config(missing)
+        )
+        return self.merge_repaired_sections(prepared, partial, missing, response)
+
+    async def complete_document_async(self, prepared, partial, retry_whole=False):
+        """complete_document的非同步版本；retry_whole時，完全無法解析的項目以單份結構化請求重試一次"""
+        if self.validate_content(partial, prepared['sections']):
+            return self.finish_document(prepared, content=partial)
+        if not partial:
+            if not retry_whole:
+                return self.finish_document(prepared)
+            response = await self.generate_with_gemini_async(
+                self.timed_prompt(self.create_batch_prompt, [prepared]),
+                generation_config=self.structured_config(prepared['sections'], count=1)
+            )
+            with observe_stage('parse'):
+                partial = self.parse_structured_response(response, 1, prepared['sections'])[0]
+            return await self.complete_document_async(prepared, partial)
+        
+        missing = [key for key in prepared['sections'] if not partial.get(key)]
+        for key in missing:
+            SECTION_REPAIRS.inc(key)
+        response = await self.generate_with_gemini_async(
+            self.timed_prompt(self.create_repair_prompt, prepared, partial, missing),
+            generation_config=self.structured_config(missing)
+        )
+        return self.merge_repaired_sections(prepared, partial, missing, response)
+
+    def validate_content(self, content, sections=SECTION_NAMES):
+        """檢查內容是否包含所有區段"""
+        return bool(content) and all(content.get(key) for key in sections)
+
+    async def generate_documents_batch_async(self, document_type, params, count, rngs=None):
+        """以單次Gemini請求生成多份文件，只針對驗證失敗的項目重新請求
+
+        rngs為每份文件各自的random.Random（長度為count），未指定時使用全域random。
+        """
+        rngs = rngs or [random] * count
+        prepared_list = [self.prepare_document(document_type, params, rng) for rng in rngs]
+        if not self.gemini_available:
+            return [self.finish_document(prepared) for prepared in prepared_list]
+        structured = GEMINI_OUTPUT_FORMAT == 'json'
+        if params.get('section_parallel') or structured or count > 1:
+            # 只有區段並行與批次提示會略過共用區段；文字格式的單份提示仍包含全部八個區段
+            await self.load_pools_async(prepared_list)
+        
+        if params.get('section_parallel'):
+            # 區段並行模式以縮短單份文件的完成時間為優先，不合併成批次請求
+            return list(await asyncio.gather(*(self.generate_sections_async(p) for p in prepared_list)))
+        
+        partials = [{} for _ in range(count)]
+        if count > 1 or structured:
+            sections = prepared_list[0]['sections']
+            response = await self.generate_with_gemini_async(
+                self.timed_prompt(self.create_batch_prompt, prepared_list),
+                generation_config=self.structured_config(sections, count=count)
+            )
+            with observe_stage('parse'):
+                partials = self.parse_structured_response(response, count, sections)
+        
+        documents = []
+        for prepared, partial in zip(prepared_list, partials):
+            if structured:
+                # 只補請求缺漏的區段；整份無法解析的項目才單獨重新請求
+                documents.append(await self.complete_document_async(prepared, partial, retry_whole=count > 1))
+            elif self.validate_content(partial, prepared['sections']):
+                documents.append(self.finish_document(prepared, content=partial))
+            else:
+                # 只重新請求缺漏或格式錯誤的項目
+                response = await self.generate_with_gemini_async(self.text_prompt(prepared))
+                documents.append(self.finish_document(prepared, response))
+        
+        return documents
+
+    def generate_fallback_content(self, document_type, job_type_or_major, basic_info, personality_traits, rng=random):
         """生成備用內容（當Gemini不可用時）"""
         content = {
-            'education': f"{random.choice(self.universities)} - {random.choice(self.majors.get(job_type_or_major, ['通用學系']))} (學士)\n2019-2023 | GPA: {random.uniform(3.0, 4.0):.2f}/4.0",
-            'language_skills': f"英文: 中上 (TOEIC: {random.randint(650, 850)})\n日文: 基礎",
+            'education': f"{rng.choice(self.universities)} - {rng.choice(self.majors.get(job_type_or_major, ['通用學系']))} (學士)\n2019-2023 | GPA: {rng.uniform(3.0, 4.0):.2f}/4.0",
+            'language_skills': f"英文: 中上 (TOEIC: {rng.randint(650, 850)})\n日文: 基礎",
             'personality': f"我是一個{personality_traits.get('工作態度', '積極主動')}且{personality_traits.get('社交性向', '樂觀')}的人。",
             'vision': "希望能在貴公司發揮所長，與團隊共同成長。"
         }
         
         if document_type == 'job_application':
             content.update({
-                'experience': f"{random.choice(self.companies.get(job_type_or_major, ['科技公司']))} - 專員\n2023.01 - 至今\n負責相關業務推展",
+                'experience': f"{rng.choice(self.companies.get(job_type_or_major, ['科技公司']))} - 專員\n2023.01 - 至今\n負責相關業務推展",
                 'technical_skills': "Microsoft Office: 熟練\nPython: 中等",
                 'certificates': "相關專業證照",
                 'projects': "專案名稱：系統優化\n描述：提升系統效能\n技術：Python, SQL"
@@ -307,927 +2427,1319 @@ class AIResumeGenerator:
         
         return content
 
-    def generate_document(self, document_type, params):
-        """生成文件內容"""
-        basic_info = self.generate_basic_info(document_type)
-        personality_traits = self.select_personality_traits(params.get('personality_traits'))
+    def generate_bulk_columns(self, document_type, params, size, rng):
+        """以NumPy一次抽樣整批備用模板文件（需安裝numpy）
+
+        回傳欄位名稱對應陣列或串列的dict，欄位名稱以「basic_info.name」、
+        「personality_traits.工作態度」、「content.education」的形式對應單份文件的結構，
+        內容與generate_fallback_content相同。
+        """
+        import numpy as np
+        from functools import reduce
+        
+        def sample(options):
+            options = np.asarray(options)
+            return options[rng.integers(0, len(options), size)]
+        
+        def concat(*parts):
+            return reduce(np.char.add, parts)
+        
+        def constant(value):
+            return [value] * size
+        
+        if document_type == 'job_application':
+            fallback_key = params.get('job_type', 'software')
+            age = rng.integers(22, 46, size)
+        else:  # student_portfolio
+            fallback_key = params.get('target_major', 'engineering')
+            age = rng.integers(16, 20, size)
+        
+        name = concat(sample(self.names['surnames']), sample(self.names['given_names']))
+        columns = {
+            'basic_info.name': name,
+            'basic_info.city': sample(self.cities),
+            'basic_info.age': age,
+            'basic_info.email': concat(np.char.replace(np.char.lower(name), ' ', ''), '@email.com'),
+            'basic_info.phone': np.char.mod('09%08d', rng.integers(10000000, 100000000, size))
+        }
+        
+        custom_traits = params.get('personality_traits')
+        if custom_traits:
+            traits = {category: constant(value) for category, value in custom_traits.items()}
+        else:
+            traits = {category: sample(options) for category, options in self.personality_traits.items()}
+        for category, values in traits.items():
+            columns[f'personality_traits.{category}'] = values
+        
+        work_attitude = traits.get('工作態度', constant('積極主動'))
+        social = traits.get('社交性向', constant('樂觀'))
+        columns.update({
+            'content.education': concat(
+                sample(self.universities), ' - ', sample(self.majors.get(fallback_key, ['通用學系'])),
+                ' (學士)\n2019-2023 | GPA: ', np.char.mod('%.2f', rng.uniform(3.0, 4.0, size)), '/4.0'
+            ),
+            'content.language_skills': concat(
+                '英文: 中上 (TOEIC: ', np.char.mod('%d', rng.integers(650, 851, size)), ')\n日文: 基礎'
+            ),
+            'content.personality': concat('我是一個', np.asarray(work_attitude), '且', np.asarray(social), '的人。'),
+            'content.vision': constant("希望能在貴公司發揮所長，與團隊共同成長。")
+        })
+        
+        if document_type == 'job_application':
+            columns.update({
+                'content.experience': concat(
+                    sample(self.companies.get(fallback_key, ['科技公司'])), ' - 專員\n2023.01 - 至今\n負責相關業務推展'
+                ),
+                'content.technical_skills': constant("Microsoft Office: 熟練\nPython: 中等"),
+                'content.certificates': constant("相關專業證照"),
+                'content.projects': constant("專案名稱：系統優化\n描述：提升系統效能\n技術：Python, SQL")
+            })
+        else:  # student_portfolio
+            columns.update({
+                'content.experience': constant("學生會幹部 - 活動組組員\n2022.09 - 2023.06\n協助籌辦校內大型活動"),
+                'content.technical_skills': constant("程式設計: 基礎\n資料分析: 中等"),
+                'content.certificates': constant("英檢中級初試通過"),
+                'content.projects': constant("專題研究：環保議題探討\n方法：問卷調查、文獻回顧\n成果：校內科展優選")
+            })
+        
+        return columns
+
+    def prepare_document(self, document_type, params, rng=random):
+        """準備文件的基本資訊與特質；實際送出的提示依輸出格式另外建立
+
+        rng會一併保存，之後產生備用內容時沿用，使同一種子的文件每次結果相同。
+        """
+        basic_info = self.generate_basic_info(document_type, rng)
+        personality_traits = self.select_personality_traits(params.get('personality_traits'), rng)
         
         if document_type == 'job_application':
             job_type = params.get('job_type', 'software')
             company_name = params.get('company_name', '科技創新股份有限公司')
             education_level = params.get('education_level', '學士')
-            
-            prompt = self.create_job_application_prompt(
-                basic_info, job_type, company_name, personality_traits, education_level
-            )
-            
-            if self.gemini_available:
-                try:
-                    response = self.generate_with_gemini(prompt)
-                    content = self.parse_gemini_response(response)
-                except:
-                    content = self.generate_fallback_content(document_type, job_type, basic_info, personality_traits)
-            else:
-                content = self.generate_fallback_content(document_type, job_type, basic_info, personality_traits)
-                
+            fallback_key = job_type
+            shared = {'應徵職位': job_type, '目標公司': company_name, '教育程度': education_level}
+            profile = {}
         else:  # student_portfolio
             target_major = params.get('target_major', 'engineering')
-            major_name = random.choice(self.student_majors.get(target_major, ['通用學系']))
-            
-            prompt = self.create_student_portfolio_prompt(
-                basic_info, major_name, personality_traits
-            )
-            
-            if self.gemini_available:
-                try:
-                    response = self.generate_with_gemini(prompt)  # 移除 await
-                    content = self.parse_gemini_response(response)
-                except:
-                    content = self.generate_fallback_content(document_type, job_type, basic_info, personality_traits)
+            major_name = rng.choice(self.student_majors.get(target_major, ['通用學系']))
+            fallback_key = target_major
+            shared = {}
+            profile = {'目標科系': major_name}
         
-        return {
+        traits_text = ", ".join([f"{k}: {v}" for k, v in personality_traits.items()])
+        prepared = {
+            'document_type': document_type,
             'basic_info': basic_info,
             'personality_traits': personality_traits,
-            'content': content,
-            'document_type': document_type
+            'prompt': None,  # 文字格式的單份提示，由text_prompt在需要時建立
+            'fallback_key': fallback_key,
+            'rng': rng,
+            'sections': list(SECTION_NAMES),  # 需由Gemini生成的區段（其餘取自版本池）
+            'shared': shared,
+            'profile': dict({
+                '姓名': basic_info['name'],
+                '年齡': f"{basic_info['age']}歲",
+                '居住地': basic_info['city'],
+                '個人特質': traits_text
+            }, **profile)
         }
+        return prepared
 
-    def create_pdf_styles(self):
-        """創建PDF樣式"""
-        styles = getSampleStyleSheet()
-        
-        try:
-            pdfmetrics.getFont('ChineseFont')
-            font_name = 'ChineseFont'
-        except:
-            font_name = 'Helvetica'
-        
-        custom_styles = {
-            'Title': ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=18,
-                spaceAfter=30,
-                alignment=TA_CENTER,
-                fontName=font_name
-            ),
-            'Heading': ParagraphStyle(
-                'CustomHeading',
-                parent=styles['Heading2'],
-                fontSize=14,
-                spaceAfter=12,
-                spaceBefore=12,
-                fontName=font_name
-            ),
-            'Normal': ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=10,
-                spaceAfter=6,
-                fontName=font_name
+    def timed_prompt(self, build, *args):
+        """建立實際送出的提示並計入prompt階段（重建快取鍵時直接呼叫建立函式，不計時）"""
+        with observe_stage('prompt'):
+            return build(*args)
+
+    def text_prompt(self, prepared):
+        """文字格式的單份提示，只在實際送出時才建立"""
+        if prepared['prompt'] is None:
+            prepared['prompt'] = self.timed_prompt(self.create_document_prompt, prepared)
+        return prepared['prompt']
+
+    def create_document_prompt(self, prepared):
+        """單份文件以「===」分隔輸出的文字提示"""
+        if prepared['document_type'] == 'job_application':
+            return self.create_job_application_prompt(
+                prepared['basic_info'], prepared['shared']['應徵職位'], prepared['shared']['目標公司'],
+                prepared['personality_traits'], prepared['shared']['教育程度']
             )
+        return self.create_student_portfolio_prompt(
+            prepared['basic_info'], prepared['profile']['目標科系'], prepared['personality_traits']
+        )
+
+    def finish_document(self, prepared, response=None, content=None):
+        """解析回應並組合文件；沒有可用回應時改用備用內容"""
+        if content is None and response:
+            try:
+                with observe_stage('parse'):
+                    content = self.parse_gemini_response(response)
+            except Exception as e:
+                print(f"解析Gemini回應失敗: {e}")
+        
+        source = 'ai'
+        pooled = []
+        if not content:
+            FALLBACK_DOCUMENTS.inc()
+            source = 'fallback'
+            with observe_stage('fallback'):
+                content = self.fallback_for(prepared)
+        else:
+            # 以文件自己的亂數從版本池抽選共用區段
+            for key, variants in prepared.get('pooled', {}).items():
+                if not content.get(key):
+                    content[key] = prepared['rng'].choice(variants)
+                    pooled.append(key)
+        
+        DOCUMENTS_GENERATED.inc(prepared['document_type'])
+        document = self.assemble_document(prepared, content, source)
+        if pooled:
+            document['pooled_sections'] = pooled
+        return document
+
+    def fallback_for(self, prepared):
+        return self.generate_fallback_content(
+            prepared['document_type'], prepared['fallback_key'],
+            prepared['basic_info'], prepared['personality_traits'], prepared['rng']
+        )
+
+    def assemble_document(self, prepared, content, source):
+        """組合文件；source標示內容來自AI或備用模板"""
+        return {
+            'basic_info': prepared['basic_info'],
+            'personality_traits': prepared['personality_traits'],
+            'content': content,
+            'document_type': prepared['document_type'],
+            'source': source
         }
-        
-        return custom_styles
+
+    def generate_document(self, document_type, params, rng=random):
+        """生成文件內容"""
+        prepared = self.prepare_document(document_type, params, rng)
+        if not self.gemini_available:
+            return self.finish_document(prepared)
+        if params.get('section_parallel'):
+            self.load_pools([prepared])
+            return self.generate_sections(prepared)
+        if GEMINI_OUTPUT_FORMAT == 'json':
+            self.load_pools([prepared])
+            response = self.generate_with_gemini(
+                self.timed_prompt(self.create_batch_prompt, [prepared]),
+                generation_config=self.structured_config(prepared['sections'], count=1)
+            )
+            with observe_stage('parse'):
+                partial = self.parse_structured_response(response, 1, prepared['sections'])[0]
+            return self.complete_document(prepared, partial)
+        return self.finish_document(prepared, self.generate_with_gemini(self.text_prompt(prepared)))
+
+    async def generate_document_async(self, document_type, params, rng=random):
+        """以非同步方式生成文件內容"""
+        if GEMINI_OUTPUT_FORMAT == 'json' or params.get('section_parallel'):
+            return (await self.generate_documents_batch_async(document_type, params, 1, [rng]))[0]
+        prepared = self.prepare_document(document_type, params, rng)
+        response = await self.generate_with_gemini_async(self.text_prompt(prepared)) if self.gemini_available else None
+        return self.finish_document(prepared, response)
+
+    def regenerate_document(self, document_type, params, seed, index, source, batch_size=1, total=None):
+        """依任務種子重新產生文件，不呼叫Gemini
+
+        備用模板文件以相同的亂數序列重建；AI文件從回應快取取回原本的回應再解析
+        （批次生成時以同一批文件重建批次提示），快取已失效時拋出DocumentUnavailableError，
+        不以不同的內容取代使用者已看過的文件。
+        """
+        rng_index, prepared_list = index, None
+        if source == 'ai' and batch_size > 1 and not params.get('section_parallel'):
+            start = index - index % batch_size
+            end = min(start + batch_size, total if total is not None else start + batch_size)
+            if end - start > 1:
+                prepared_list = [
+                    self.prepare_document(document_type, params, document_rng(seed, i)) for i in range(start, end)
+                ]
+                rng_index = index - start
+        
+        content = None
+        if prepared_list is not None:
+            prepared = prepared_list[rng_index]
+            cached = self.get_cached_response(self.create_batch_prompt(prepared_list))
+            if cached:
+                content = self.parse_batch_response(cached, len(prepared_list))[rng_index]
+        else:
+            prepared = self.prepare_document(document_type, params, document_rng(seed, index))
+        
+        if source == 'ai' and content is None and params.get('section_parallel'):
+            cached = [self.get_cached_response(self.create_section_prompt(prepared, key)) for key in SECTION_NAMES]
+            if all(cached):
+                content = {key: text.strip() for key, text in zip(SECTION_NAMES, cached)}
+        
+        if source == 'ai' and content is None:
+            # 單份生成或批次中重新請求的項目：先找結構化輸出的提示，再找文字輸出的提示
+            cached = self.get_cached_response(self.create_batch_prompt([prepared]))
+            if cached:
+                content = self.parse_batch_response(cached, 1)[0]
+        
+        if source == 'ai' and content is None:
+            cached = self.get_cached_response(self.create_document_prompt(prepared))
+            if cached:
+                try:
+                    content = self.parse_gemini_response(cached)
+                except Exception as e:
+                    print(f"解析快取回應失敗: {e}")
+        
+        if source == 'ai' and not content:
+            raise DocumentUnavailableError(f'第 {index + 1} 份文件的AI回應已不在快取中，無法重建')
+        if not content:
+            return self.assemble_document(prepared, self.fallback_for(prepared), 'fallback')
+        return self.assemble_document(prepared, content, 'ai')
+
+    def create_pdf_styles(self):
+        """取得PDF樣式（整個程序共用，只建立一次）"""
+        return self.pdf_context.get_styles()
 
     def generate_pdf(self, document_data, filename):
         """生成PDF文件"""
-        doc = SimpleDocTemplate(filename, pagesize=A4)
-        styles = self.create_pdf_styles()
-        story = []
-        
-        basic_info = document_data['basic_info']
-        content = document_data['content']
-        document_type = document_data['document_type']
-        
-        # 標題
-        if document_type == 'job_application':
-            title = f"履歷表 - {basic_info['name']}"
+        self.pdf_context.build_pdf(document_data, filename)
+
+    def render_pdf(self, document_data):
+        """生成PDF並以bytes回傳"""
+        return self.pdf_context.render(document_data)
+
+# 生成器在第一次使用時才初始化
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_generator():
+    """取得（必要時建立）共用的AI履歷生成器"""
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = AIResumeGenerator()
+        return _generator
+
+# 已產生的PDF快取，鍵為 (任務ID, 文件索引, 內容雜湊)
+pdf_cache = LRUCache(PDF_CACHE_MAX_BYTES)
+
+def document_pdf_filename(document, index):
+    """文件PDF的下載檔名"""
+    doc_type_name = "履歷" if document['document_type'] == 'job_application' else "學習歷程"
+    return f"{doc_type_name}_{document['basic_info']['name']}_{index+1:03d}.pdf"
+
+def pdf_cache_key(task_id, index, document):
+    content_hash = hashlib.sha256(
+        json.dumps(document, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return (task_id, index, content_hash)
+
+def get_document_pdf(task_id, index, document):
+    """取得文件的PDF，優先使用快取中已產生的內容"""
+    key = pdf_cache_key(task_id, index, document)
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is None:
+        recorder = TraceRecorder(task_id)
+        with trace_scope(recorder, index):
+            pdf_bytes = get_generator().render_pdf(document)
+        recorder.flush()
+        pdf_cache.set(key, pdf_bytes, len(pdf_bytes))
+    return pdf_bytes
+
+# PDF工作程序池（第一次打包ZIP時才建立）
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def init_pdf_worker():
+    """PDF工作程序啟動時只載入一次中文字體（不建立生成器，不開啟快取與資料庫）"""
+    global _pdf_render_context
+    # 以spawn啟動的新程序沒有主程序的字體狀態，重新建立並同步載入字體
+    _pdf_render_context = PDFRenderContext()
+    _pdf_render_context.wait_until_ready()
+
+def render_pdf_in_worker(document):
+    """在工作程序中生成PDF，一併回傳耗時供主程序記錄指標"""
+    start = time.perf_counter()
+    pdf_bytes = _pdf_render_context.render(document)
+    return pdf_bytes, time.perf_counter() - start
+
+def get_pdf_pool():
+    """取得PDF工作程序池"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # 主程序已有背景載入字體與處理請求的執行緒，fork可能繼承被持有的import鎖而卡死，改用spawn
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, initializer=init_pdf_worker,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pdf_pool
+
+def render_document_pdfs(task_id, documents):
+    """為多份文件產生PDF，依完成順序回傳 (index, document, pdf_bytes)
+
+    已快取的PDF直接回傳，其餘交由工作程序池平行生成；同時進行的數量有上限，
+    避免取用端較慢時結果堆積在記憶體中。
+    """
+    parallel = PDF_WORKERS > 1
+    pool = get_pdf_pool() if parallel else None
+    recorder = TraceRecorder(task_id)
+    max_in_flight = PDF_WORKERS * 2
+    in_flight = {}
+    
+    def collect(block):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED) if block else (
+            [future for future in in_flight if future.done()], None)
+        for future in done:
+            index, document, key = in_flight.pop(future)
+            pdf_bytes, elapsed = future.result()
+            STAGE_SECONDS.observe(elapsed, 'pdf')
+            end = time.monotonic()
+            recorder.add('pdf', end - elapsed, end, index, worker=True)
+            pdf_cache.set(key, pdf_bytes, len(pdf_bytes))
+            yield index, document, pdf_bytes
+    
+    for index, document in documents:
+        key = pdf_cache_key(task_id, index, document)
+        pdf_bytes = pdf_cache.get(key)
+        if pdf_bytes is None and not parallel:
+            with trace_scope(recorder, index):
+                pdf_bytes = get_generator().render_pdf(document)
+            pdf_cache.set(key, pdf_bytes, len(pdf_bytes))
+        
+        if pdf_bytes is not None:
+            yield index, document, pdf_bytes
         else:
-            title = f"學習歷程檔案 - {basic_info['name']}"
-            
-        story.append(Paragraph(title, styles['Title']))
-        story.append(Spacer(1, 12))
-        
-        # 基本資訊
-        contact_info = [
-            f"聯絡資訊：{basic_info['email']} | {basic_info['phone']}",
-            f"居住地：{basic_info['city']} | 年齡：{basic_info['age']}歲"
-        ]
-        
-        for info in contact_info:
-            story.append(Paragraph(info, styles['Normal']))
-        
-        story.append(Spacer(1, 12))
-        
-        # 個人特質
-        story.append(Paragraph("個人特質", styles['Heading']))
-        traits_text = " | ".join([f"{k}: {v}" for k, v in document_data['personality_traits'].items()])
-        story.append(Paragraph(traits_text, styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        # 根據文件類型添加相應內容
-        if document_type == 'job_application':
-            sections = [
-                ('學歷背景', 'education'),
-                ('語言能力', 'language_skills'),
-                ('工作經驗', 'experience'),
-                ('專業技能', 'technical_skills'),
-                ('證照資格', 'certificates'),
-                ('專案經驗', 'projects'),
-                ('個人特質描述', 'personality'),
-                ('對公司願景', 'vision')
-            ]
-        else:  # student_portfolio
-            sections = [
-                ('學業表現', 'education'),
-                ('語言能力', 'language_skills'),
-                ('課外活動', 'experience'),
-                ('競賽經驗', 'technical_skills'),
-                ('志工服務', 'certificates'),
-                ('專題研究', 'projects'),
-                ('個人特質描述', 'personality'),
-                ('學習動機', 'vision')
-            ]
+            in_flight[pool.submit(render_pdf_in_worker, document)] = (index, document, key)
+            yield from collect(block=len(in_flight) >= max_in_flight)
+    
+    while in_flight:
+        yield from collect(block=True)
+    
+    recorder.flush()
+
+class ZipStreamBuffer(io.RawIOBase):
+    """接收ZipFile寫出的資料，讓串流回應可以分段送出（不可seek）"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def take(self):
+        """取出目前累積的資料"""
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def stream_zip(task_id, documents):
+    """逐份生成PDF並以串流方式送出ZIP，不寫入任何暫存檔"""
+    recorder = TraceRecorder(task_id)
+    with trace_scope(recorder):
+        with observe_stage('zip'):
+            buffer = ZipStreamBuffer()
+            with zipfile.ZipFile(buffer, 'w') as zipf:
+                for i, document, pdf_bytes in render_document_pdfs(task_id, documents):
+                    zipf.writestr(document_pdf_filename(document, i), pdf_bytes)
+                    yield buffer.take()
+            yield buffer.take()
+    recorder.flush()
+
+def compact_document(document):
+    """可由種子重新產生的文件只保存來源標記（依LAZY_DOCUMENTS設定）"""
+    if document.get('repaired_sections') or document.get('pooled_sections'):
+        # 補請求過區段或取自版本池的文件無法只從單一回應重建
+        return document
+    source = document.get('source')
+    if LAZY_DOCUMENTS == 'all' and source == 'ai':
+        # 只有回應保存到檔案、且保留時間不短於任務本身時，AI文件才可只存標記
+        response_cache = get_generator().response_cache
+        if response_cache is not None and response_cache.durable_for(TASK_TTL):
+            return {'regenerate': 'ai'}
+        return document
+    if LAZY_DOCUMENTS in ('fallback', 'all') and source == 'fallback':
+        return {'regenerate': 'fallback'}
+    return document
+
+def load_document(task, index, document):
+    """還原只保存來源標記的文件"""
+    if document is None or 'regenerate' not in document:
+        return document
+    return get_generator().regenerate_document(
+        task['document_type'], task['params'], task['seed'], index, document['regenerate'],
+        task.get('batch_size', 1), task['total']
+    )
+
+def iter_task_documents(task_id, task, exclude=()):
+    """依順序回傳任務的 (index, document)，並還原只保存來源標記的文件"""
+    for index, document in get_task_store().iter_documents(task_id, exclude=exclude):
+        yield index, load_document(task, index, document)
+
+class FairScheduler:
+    """在多個任務之間以加權輪詢分派工作，並限制所有任務合計同時進行的工作數
+
+    每個任務依priority在一輪中連續取得相同數量的名額，避免大量文件的任務
+    佔滿名額；只在所屬事件迴圈中使用，不需加鎖。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.loop = asyncio.get_running_loop()
+        self.queues = {}
+        self.weights = {}
+        self.served = {}
+        self.order = deque()
+        self.running = {}
+        self.in_flight = 0
+
+    def submit(self, task_id, factory, priority=1):
+        """排入一個工作（呼叫factory()取得協程），回傳工作完成時的future"""
+        future = self.loop.create_future()
+        if task_id not in self.queues:
+            self.queues[task_id] = deque()
+            self.weights[task_id] = max(1, int(priority))
+            self.served[task_id] = 0
+            self.order.append(task_id)
+        self.queues[task_id].append((factory, future))
+        QUEUE_DEPTH.inc()
+        self._dispatch()
+        return future
+
+    def _next(self):
+        while self.order:
+            task_id = self.order[0]
+            queue = self.queues.get(task_id)
+            if not queue:
+                self.order.popleft()
+                self.queues.pop(task_id, None)
+                self.weights.pop(task_id, None)
+                self.served.pop(task_id, None)
+                continue
+            item = queue.popleft()
+            self.served[task_id] += 1
+            if self.served[task_id] % self.weights[task_id] == 0:
+                self.order.rotate(-1)
+            return task_id, item
+        return None
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity:
+            picked = self._next()
+            if picked is None:
+                return
+            task_id, (factory, future) = picked
+            QUEUE_DEPTH.dec()
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            job = self.loop.create_task(factory())
+            self.running.setdefault(task_id, set()).add(job)
+            job.add_done_callback(lambda job, task_id=task_id, future=future: self._finished(task_id, future, job))
+
+    def _finished(self, task_id, future, job):
+        self.in_flight -= 1
+        jobs = self.running.get(task_id)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self.running[task_id]
+        if not future.done():
+            if job.cancelled():
+                future.cancel()
+            elif job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                future.set_result(job.result())
+        self._dispatch()
+
+    def cancel(self, task_id):
+        """捨棄任務尚未開始的工作，並中止進行中的工作（包含等待中的API呼叫）"""
+        for _, future in self.queues.pop(task_id, ()):
+            QUEUE_DEPTH.dec()
+            future.cancel()
+        for job in list(self.running.get(task_id, ())):
+            job.cancel()
+
+_scheduler = None
+
+def get_scheduler():
+    """取得目前事件迴圈的排程器（網頁程序的背景迴圈或worker程序的迴圈各一個）"""
+    global _scheduler
+    if _scheduler is None or _scheduler.loop is not asyncio.get_running_loop():
+        _scheduler = FairScheduler(GENERATION_CONCURRENCY)
+    return _scheduler
+
+async def run_generation_task(task_id, document_type, params, count, batch_size=1, priority=1):
+    """將任務的文件分批交給公平排程器，與其他任務輪流生成；任務被取消時中止剩餘工作"""
+    task = get_task_store().get_task(task_id)
+    if task is None or task['status'] not in ACTIVE_STATUSES:
+        return
+    
+    seed = task.get('seed')
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+        get_task_store().update_task(task_id, seed=seed, params=params, batch_size=batch_size)
+    generator = get_generator()
+    scheduler = get_scheduler()
+    recorder = TraceRecorder(task_id)
+    task_started_at = time.monotonic()
+    completed = 0
+    cancelled = False
+    
+    def is_cancelled():
+        nonlocal cancelled
+        task = get_task_store().get_task(task_id)
+        if task is None or task['status'] == 'cancelled':
+            cancelled = True
+            scheduler.cancel(task_id)
+        return cancelled
+    
+    async def generate_batch(start, size, queued_at):
+        nonlocal completed
+        started_at = time.monotonic()
+        recorder.add('queue', queued_at, started_at, start)
+        if is_cancelled():
+            return
+        get_task_store().update_task(task_id, expected_status=('queued',), status='started', message='生成中...')
+        rngs = [document_rng(seed, start + offset) for offset in range(size)]
+        with trace_scope(recorder, start):
+            if size > 1:
+                documents = await generator.generate_documents_batch_async(document_type, params, size, rngs)
+            else:
+                documents = [await generator.generate_document_async(document_type, params, rngs[0])]
+        recorder.add('document', started_at, time.monotonic(), start, size=size)
+        # 完成的文件依原始位置逐一寫入；可重新產生的文件只存來源標記
+        get_task_store().set_documents(task_id, start, [compact_document(document) for document in documents])
+        completed += len(documents)
+        get_task_store().update_task(
+            task_id, progress=completed, message=f'生成中... {completed}/{count}',
+            concurrency=generator.concurrency_limiter.window
+        )
+        recorder.flush()
+        notify_progress()
+    
+    async def watch_cancellation():
+        # 取消可能來自其他程序（/cancel 只更新任務存儲），因此以輪詢中止進行中的工作
+        while not is_cancelled():
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+    
+    TASKS_IN_FLIGHT.inc()
+    status = 'error'
+    watcher = asyncio.ensure_future(watch_cancellation())
+    try:
+        # 依批次大小切分，交由排程器與其他任務輪流執行
+        batch_size = max(1, batch_size)
+        queued_at = time.monotonic()
+        await asyncio.gather(*(
+            scheduler.submit(
+                task_id,
+                lambda start=start: generate_batch(start, min(batch_size, count - start), queued_at),
+                priority
+            )
+            for start in range(0, count, batch_size)
+        ))
         
-        for section_title, section_key in sections:
-            if section_key in content and content[section_key]:
-                story.append(Paragraph(section_title, styles['Heading']))
-                story.append(Paragraph(content[section_key], styles['Normal']))
-                story.append(Spacer(1, 12))
+        status = 'completed'
+        get_task_store().update_task(task_id, expected_status=ACTIVE_STATUSES, status='completed', message='生成完成！')
         
-        doc.build(story)
-
-# 初始化生成器
-generator = AIResumeGenerator()
+    except asyncio.CancelledError:
+        if not cancelled:
+            scheduler.cancel(task_id)
+            raise
+        status = 'cancelled'
+    except Exception as e:
+        scheduler.cancel(task_id)
+        get_task_store().update_task(task_id, expected_status=ACTIVE_STATUSES, status='error', message=str(e))
+    finally:
+        watcher.cancel()
+        TASKS_IN_FLIGHT.dec()
+        recorder.add('task', task_started_at, time.monotonic(), status=status, documents=count)
+        recorder.flush()
+    
+    notify_progress()
 
-@app.route('/')
+@bp.route('/')
 def index():
     """主頁面"""
-    return render_template('index.html', personality_traits=generator.personality_traits)
+    return render_template('index.html', personality_traits=get_generator().personality_traits)
+
+def build_generation_params(data, document_type):
+    """從請求資料整理生成參數"""
+    if document_type == 'job_application':
+        return {
+            'job_type': data.get('jobType', 'software'),
+            'company_name': data.get('companyName', '科技創新股份有限公司'),
+            'education_level': data.get('educationLevel', '學士'),
+            'personality_traits': data.get('personalityTraits'),
+            'section_parallel': bool(data.get('sectionParallel', SECTION_PARALLEL))
+        }
+    # student_portfolio
+    return {
+        'target_major': data.get('targetMajor', 'engineering'),
+        'personality_traits': data.get('personalityTraits'),
+        'section_parallel': bool(data.get('sectionParallel', SECTION_PARALLEL))
+    }
 
-@app.route('/generate', methods=['POST'])
+@bp.route('/generate', methods=['POST'])
 def generate_documents():
     """生成文件"""
     try:
         data = request.json
         count = int(data.get('count', 5))
         document_type = data.get('documentType', 'job_application')
+        batch_size = int(data.get('batchSize', GEMINI_BATCH_SIZE))
+        priority = int(data.get('priority', 1))
+        seed = int(data['seed']) if data.get('seed') is not None else random.randrange(2 ** 32)
         
         if count < 1 or count > 50:
             return jsonify({'error': '請輸入1-50之間的數量'}), 400
         
+        if batch_size < 1 or batch_size > GEMINI_MAX_BATCH_SIZE:
+            return jsonify({'error': f'批次大小需介於1-{GEMINI_MAX_BATCH_SIZE}之間'}), 400
+        
+        if priority < 1 or priority > MAX_TASK_PRIORITY:
+            return jsonify({'error': f'優先權需介於1-{MAX_TASK_PRIORITY}之間'}), 400
+        
         # 生成任務ID
         task_id = f"task_{int(time.time())}_{random.randint(1000, 9999)}"
         
         # 初始化進度
-        generation_progress[task_id] = {
-            'status': 'started',
-            'progress': 0,
-            'total': count,
-            'documents': [],
-            'message': '準備中...'
-        }
-        
-        # 在背景執行生成任務
-        def generate_task():
-            try:
-                import asyncio
-                
-                async def async_generate():
-                    documents = []
-                    
-                    for i in range(count):
-                        generation_progress[task_id]['progress'] = i + 1
-                        generation_progress[task_id]['message'] = f'生成中... {i+1}/{count}'
-                        
-                        # 準備參數
-                        params = {}
-                        if document_type == 'job_application':
-                            params = {
-                                'job_type': data.get('jobType', 'software'),
-                                'company_name': data.get('companyName', '科技創新股份有限公司'),
-                                'education_level': data.get('educationLevel', '學士'),
-                                'personality_traits': data.get('personalityTraits')
-                            }
-                        else:  # student_portfolio
-                            params = {
-                                'target_major': data.get('targetMajor', 'engineering'),
-                                'personality_traits': data.get('personalityTraits')
-                            }
-                        
-                        document = generator.generate_document(document_type, params)
-                        documents.append(document)
-                        
-                        time.sleep(0.2)  # 避免API限制
-                    
-                    generation_progress[task_id]['status'] = 'completed'
-                    generation_progress[task_id]['documents'] = documents
-                    generation_progress[task_id]['message'] = '生成完成！'
-                
-                # 運行異步函數
-                asyncio.run(async_generate())
-                
-            except Exception as e:
-                generation_progress[task_id]['status'] = 'error'
-                generation_progress[task_id]['message'] = str(e)
-        
-        # 啟動背景線程
-        thread = threading.Thread(target=generate_task)
-        thread.daemon = True
-        thread.start()
+        # 保存種子與參數，文件可依此重現或在讀取時重新產生
+        params = build_generation_params(data, document_type)
+        get_task_store().create_task(
+            task_id, count, document_type=document_type, params=params, seed=seed, batch_size=batch_size
+        )
+        enqueued_at = time.monotonic()
+        get_task_store().add_spans(task_id, [{'name': 'enqueue', 'start': enqueued_at, 'end': enqueued_at, 'doc': None}])
+        
+        # 排入任務佇列；未完成的任務過多時拒絕，避免佔滿網頁程序
+        try:
+            get_job_queue().enqueue(task_id, {
+                'document_type': document_type, 'params': params, 'count': count,
+                'batch_size': batch_size, 'priority': priority
+            })
+        except QueueFullError:
+            get_task_store().delete_task(task_id)
+            JOB_REJECTIONS.inc()
+            return jsonify({'error': '目前排隊的任務已滿，請稍後再試'}), 503, {'Retry-After': '5'}
         
-        return jsonify({'task_id': task_id})
+        return jsonify({'task_id': task_id, 'seed': seed})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/progress/<task_id>')
+def iter_bulk_chunks(document_type, params, count, chunk_size, seed=None):
+    """逐塊產生模板大量模式的欄位資料，每個區塊為一行JSON"""
+    import numpy as np
+    
+    generator = get_generator()
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, chunk_size):
+        size = min(chunk_size, count - start)
+        with observe_stage('bulk'):
+            columns = generator.generate_bulk_columns(document_type, params, size, rng)
+            line = json.dumps({
+                'start': start,
+                'count': size,
+                'document_type': document_type,
+                'columns': {key: values.tolist() if hasattr(values, 'tolist') else values
+                            for key, values in columns.items()}
+            }, ensure_ascii=False)
+        DOCUMENTS_GENERATED.inc(document_type, amount=size)
+        yield line + '\n'
+
+@bp.route('/generate_bulk', methods=['POST'])
+def generate_bulk():
+    """模板大量模式：不呼叫Gemini，以欄位區塊串流大量備用模板文件（NDJSON）"""
+    data = request.json or {}
+    document_type = data.get('documentType', 'job_application')
+    try:
+        count = int(data.get('count', 1000))
+        chunk_size = int(data.get('chunkSize', BULK_CHUNK_SIZE))
+        seed = data.get('seed')
+        seed = int(seed) if seed is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': '數量、區塊大小與種子需為整數'}), 400
+    
+    if count < 1 or count > BULK_MAX_DOCUMENTS:
+        return jsonify({'error': f'請輸入1-{BULK_MAX_DOCUMENTS}之間的數量'}), 400
+    
+    if chunk_size < 1:
+        return jsonify({'error': '區塊大小需大於0'}), 400
+    
+    if importlib.util.find_spec('numpy') is None:
+        return jsonify({'error': '模板大量模式需要安裝numpy'}), 501
+    
+    params = build_generation_params(data, document_type)
+    return Response(
+        iter_bulk_chunks(document_type, params, count, chunk_size, seed),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/cancel/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """取消任務：停止尚未開始的文件並中止進行中的API呼叫，已完成的文件保留"""
+    task = get_task_store().get_task(task_id)
+    if task is None:
+        return jsonify({'error': '任務不存在'}), 404
+    
+    if not get_task_store().update_task(task_id, expected_status=ACTIVE_STATUSES, status='cancelled', message='已取消'):
+        return jsonify({'error': '任務已結束', 'status': get_task_store().get_task(task_id)['status']}), 409
+    
+    notify_progress()
+    return jsonify({'task_id': task_id, 'status': 'cancelled'})
+
+@bp.route('/progress/<task_id>')
 def get_progress(task_id):
     """獲取生成進度"""
-    if task_id not in generation_progress:
+    task = get_task_store().get_task(task_id)
+    if task is None:
+        return jsonify({'error': '任務不存在'}), 404
+    
+    return jsonify(task)
+
+def format_sse(event, data, event_id=None):
+    """格式化Server-Sent Events訊息"""
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n" + message
+    return message
+
+@bp.route('/stream/<task_id>')
+def stream_task(task_id):
+    """以Server-Sent Events推送進度與每份完成的文件
+
+    失敗時送出failed事件（error是EventSource內建的連線錯誤事件，不可共用名稱）；
+    每份文件以索引作為事件ID，重連時從頭重送，由前端略過已收到的索引。
+    """
+    if task_id not in get_task_store():
+        return jsonify({'error': '任務不存在'}), 404
+    
+    def event_stream():
+        sent = set()
+        last_progress = None
+        idle_since = time.monotonic()
+        version = progress_version
+        while True:
+            task = get_task_store().get_task(task_id)
+            if task is None:
+                yield format_sse('failed', {'message': '任務不存在'})
+                return
+            
+            status = task['status']
+            current = (status, task['progress'], task['message'])
+            if current != last_progress:
+                last_progress = current
+                yield format_sse('progress', {
+                    'status': status, 'progress': task['progress'],
+                    'total': task['total'], 'message': task['message'],
+                    'concurrency': task.get('concurrency')
+                })
+            
+            new_documents = list(iter_task_documents(task_id, task, exclude=sent))
+            for i, document in new_documents:
+                sent.add(i)
+                yield format_sse('document', dict(document, index=i), event_id=i)
+            
+            if status == 'completed':
+                yield format_sse('done', {'total': task['total']})
+                return
+            if status == 'error':
+                yield format_sse('failed', {'message': task['message']})
+                return
+            if status == 'cancelled':
+                yield format_sse('cancelled', {'progress': task['progress'], 'total': task['total']})
+                return
+            
+            if new_documents:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= SSE_KEEPALIVE_SECONDS:
+                idle_since = time.monotonic()
+                yield ": keep-alive\n\n"
+            
+            # 等待同程序內的更新通知，或逾時後重新查詢（其他程序的更新）
+            version = wait_for_progress(version, SSE_POLL_SECONDS)
+    
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/queue/stats')
+def get_queue_stats():
+    """獲取任務佇列的積壓數量"""
+    return jsonify(get_job_queue().stats())
+
+@bp.route('/store/stats')
+def get_store_stats():
+    """獲取任務存儲的記憶體與磁碟使用量"""
+    return jsonify(get_task_store().stats())
+
+def build_chrome_trace(task_id, spans):
+    """將時間軸區段轉換為Chrome trace-event格式（時間單位為微秒）"""
+    origin = min((span['start'] for span in spans), default=0)
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 0, 'args': {'name': '任務'}}]
+    named_threads = {0}
+    
+    for span in spans:
+        tid = 0 if span['doc'] is None else span['doc'] + 1
+        if tid not in named_threads:
+            named_threads.add(tid)
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': f'文件 {tid}'}})
+        
+        event = {
+            'name': span['name'],
+            'cat': 'task' if tid == 0 else 'document',
+            'ts': (span['start'] - origin) * 1e6,
+            'pid': 1,
+            'tid': tid,
+            'args': span.get('args', {})
+        }
+        duration = (span['end'] - span['start']) * 1e6
+        if duration > 0:
+            event.update(ph='X', dur=duration)
+        else:
+            event.update(ph='i', s='t')
+        events.append(event)
+    
+    return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'task_id': task_id}}
+
+@bp.route('/trace/<task_id>')
+def get_trace(task_id):
+    """獲取任務的時間軸（Chrome trace-event格式，可用 chrome://tracing 或 Perfetto 開啟）"""
+    if task_id not in get_task_store():
         return jsonify({'error': '任務不存在'}), 404
     
-    return jsonify(generation_progress[task_id])
+    return jsonify(build_chrome_trace(task_id, get_task_store().get_spans(task_id)))
 
-@app.route('/documents/<task_id>')
+@bp.route('/metrics')
+def get_metrics():
+    """以Prometheus文字格式輸出指標"""
+    JOB_BACKLOG.set(get_job_queue().backlog())
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/cache/stats')
+def get_cache_stats():
+    """獲取Gemini回應快取、PDF快取與共用區段版本池統計"""
+    generator = get_generator()
+    section_pool = generator.section_pool.stats() if generator.section_pool is not None else None
+    if generator.response_cache is None:
+        return jsonify({'enabled': False, 'pdf': pdf_cache.stats(), 'section_pool': section_pool})
+    
+    return jsonify(dict(
+        generator.response_cache.stats(), enabled=True, pdf=pdf_cache.stats(), section_pool=section_pool
+    ))
+
+@bp.route('/documents/<task_id>')
 def get_documents(task_id):
     """獲取生成的文件列表"""
-    if task_id not in generation_progress:
+    task = get_task_store().get_task(task_id)
+    if task is None:
         return jsonify({'error': '任務不存在'}), 404
     
-    task = generation_progress[task_id]
-    if task['status'] != 'completed':
+    if task['status'] not in FINISHED_WITH_DOCUMENTS:
         return jsonify({'error': '任務尚未完成'}), 400
     
     # 只返回必要的資訊用於顯示
     document_list = []
-    for i, document in enumerate(task['documents']):
+    for i, document in iter_task_documents(task_id, task):
         doc_summary = {
             'index': i,
             'basic_info': document['basic_info'],
             'personality_traits': document['personality_traits'],
             'content': document['content'],
-            'document_type': document['document_type']
+            'document_type': document['document_type'],
+            'source': document.get('source')
         }
         document_list.append(doc_summary)
     
     return jsonify({'documents': document_list})
 
-@app.route('/download/<task_id>/<int:doc_index>')
+@bp.route('/download/<task_id>/<int:doc_index>')
 def download_single_pdf(task_id, doc_index):
     """下載單份文件PDF"""
-    if task_id not in generation_progress:
+    task = get_task_store().get_task(task_id)
+    if task is None:
         return jsonify({'error': '任務不存在'}), 404
     
-    task = generation_progress[task_id]
-    if task['status'] != 'completed':
+    if task['status'] not in FINISHED_WITH_DOCUMENTS:
         return jsonify({'error': '任務尚未完成'}), 400
     
-    if doc_index >= len(task['documents']):
+    document = load_document(task, doc_index, get_task_store().get_document(task_id, doc_index))
+    if document is None:
         return jsonify({'error': '文件索引無效'}), 400
     
-    document = task['documents'][doc_index]
-    
-    # 創建臨時PDF檔案
-    temp_dir = tempfile.mkdtemp()
-    doc_type_name = "履歷" if document['document_type'] == 'job_application' else "學習歷程"
-    filename = f"{doc_type_name}_{document['basic_info']['name']}_{doc_index+1:03d}.pdf"
-    filepath = os.path.join(temp_dir, filename)
+    filename = document_pdf_filename(document, doc_index)
     
     try:
-        generator.generate_pdf(document, filepath)
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        pdf_bytes = get_document_pdf(task_id, doc_index, document)
+        return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True, download_name=filename)
     except Exception as e:
         return jsonify({'error': f'PDF生成失敗: {str(e)}'}), 500
 
-@app.route('/download_all/<task_id>')
+@bp.errorhandler(DocumentUnavailableError)
+def document_unavailable(error):
+    """AI文件無法重建時明確回報，而不是回傳不同的內容"""
+    return jsonify({'error': str(error)}), 410
+
+@bp.route('/download_all/<task_id>')
 def download_all_pdfs(task_id):
     """下載所有文件PDF (打包成ZIP)"""
-    if task_id not in generation_progress:
+    task = get_task_store().get_task(task_id)
+    if task is None:
         return jsonify({'error': '任務不存在'}), 404
     
-    task = generation_progress[task_id]
-    if task['status'] != 'completed':
+    if task['status'] not in FINISHED_WITH_DOCUMENTS:
         return jsonify({'error': '任務尚未完成'}), 400
     
-    # 創建臨時目錄
-    temp_dir = tempfile.mkdtemp()
-    doc_type_name = "履歷集合" if task['documents'][0]['document_type'] == 'job_application' else "學習歷程集合"
-    zip_filename = f"{doc_type_name}_{len(task['documents'])}份.zip"
-    zip_filepath = os.path.join(temp_dir, zip_filename)
+    doc_type_name = "履歷集合" if task['document_type'] == 'job_application' else "學習歷程集合"
+    zip_filename = f"{doc_type_name}_{task['total']}份.zip"
+    
+    def generate():
+        try:
+            yield from stream_zip(task_id, iter_task_documents(task_id, task))
+        except Exception as e:
+            # 回應已開始傳送，無法再改為錯誤狀態碼
+            print(f"ZIP生成失敗: {e}")
+            raise
+    
+    return Response(
+        generate(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(zip_filename)}"}
+    )
+
+def create_app(config=None):
+    """建立Flask應用程式；config可包含STORE_CONFIG_KEYS指定任務存儲與佇列"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'ai_resume_generator_2024'
+    if config:
+        app.config.update(config)
+        configure_stores(config)
+    app.register_blueprint(bp)
+    return app
+
+def load_json_file(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def read_batch_checkpoint(jsonl_path, pdf_dir):
+    """從既有輸出讀取已完成的文件，作為續跑的檢查點
+
+    JSONL每行在寫入後才算完成，結尾不完整的一行會被截掉；只輸出PDF時以目錄中
+    已存在的檔案為準。同時輸出兩者時以JSONL為準，缺少PDF的文件直接由JSONL補產生。
+    回傳 (已完成的索引集合, 需補產生PDF的 {索引: 文件})。
+    """
+    pdf_indices = set()
+    if pdf_dir and os.path.isdir(pdf_dir):
+        for filename in os.listdir(pdf_dir):
+            match = re.search(r'_(\d+)\.pdf$', filename)
+            if match:
+                pdf_indices.add(int(match.group(1)) - 1)
+    
+    if not jsonl_path:
+        return pdf_indices, {}
+    
+    completed = set()
+    missing_pdfs = {}
+    valid_bytes = 0
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                    index = record['index']
+                except (ValueError, KeyError):
+                    break
+                valid_bytes += len(line)
+                completed.add(index)
+                if pdf_dir and index not in pdf_indices:
+                    missing_pdfs[index] = record['document']
+        with open(jsonl_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return completed, missing_pdfs
+
+def batch_meta_path(args):
+    """記錄種子與參數的檔案，放在輸出旁邊供續跑時比對"""
+    if args.jsonl:
+        return args.jsonl + '.meta.json'
+    return os.path.join(args.pdf_dir, 'batch_meta.json')
+
+def check_batch_meta(args, settings, has_progress):
+    """續跑時沿用先前的種子並確認參數一致，回傳錯誤訊息（沒有問題時為None）"""
+    path = batch_meta_path(args)
+    if not os.path.exists(path):
+        if has_progress and args.seed is None:
+            return f"找不到 {path}，無法得知先前使用的種子，請以 --seed 指定"
+        return None
+    
+    meta = load_json_file(path)
+    if args.seed is None:
+        args.seed = meta['seed']
+    elif args.seed != meta['seed']:
+        return f"--seed {args.seed} 與先前的種子 {meta['seed']} 不同，續跑會混合兩組種子的文件"
+    if meta['settings'] != settings:
+        return f"生成參數與 {path} 記錄的不同，續跑會混合兩組參數的文件"
+    return None
+
+async def run_batch(args, generator, params_for, pending, missing_pdfs, jsonl_file):
+    """以固定數量的工作協程生成文件，完成一份就寫出一份"""
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_pool() if args.pdf_dir and PDF_WORKERS > 1 else None
+    batches = deque(pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size))
+    total = len(pending) + len(missing_pdfs)
+    finished = 0
+    started_at = last_report = time.monotonic()
+    
+    def report(force=False):
+        nonlocal last_report
+        now = time.monotonic()
+        if not force and now - last_report < args.progress_interval:
+            return
+        last_report = now
+        elapsed = max(now - started_at, 1e-9)
+        print(
+            f"[batch] {finished}/{total} 份 | {finished / elapsed:.1f} 份/秒 | "
+            f"並行視窗 {generator.concurrency_limiter.window} | 經過 {elapsed:.0f} 秒",
+            file=sys.stderr, flush=True
+        )
+    
+    async def write_pdf(index, document):
+        if pool is not None:
+            pdf_bytes, _ = await loop.run_in_executor(pool, render_pdf_in_worker, document)
+        else:
+            pdf_bytes = generator.render_pdf(document)
+        path = os.path.join(args.pdf_dir, document_pdf_filename(document, index))
+        with open(path + '.tmp', 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(path + '.tmp', path)
+    
+    def mark_finished():
+        nonlocal finished
+        finished += 1
+        report()
+    
+    async def write_outputs(index, document):
+        # 先寫PDF再寫JSONL，JSONL中有紀錄即代表該文件已完整輸出
+        if args.pdf_dir:
+            await write_pdf(index, document)
+        if jsonl_file is not None:
+            jsonl_file.write(json.dumps({'index': index, 'document': document}, ensure_ascii=False) + '\n')
+            jsonl_file.flush()
+        mark_finished()
+    
+    async def worker():
+        while missing_pdfs:
+            index, document = missing_pdfs.popitem()
+            await write_pdf(index, document)
+            mark_finished()
+        while batches:
+            indices = batches.popleft()
+            params = params_for(indices[0])
+            rngs = [document_rng(args.seed, index) for index in indices]
+            if len(indices) > 1:
+                documents = await generator.generate_documents_batch_async(args.type, params, len(indices), rngs)
+            else:
+                documents = [await generator.generate_document_async(args.type, params, rngs[0])]
+            for index, document in zip(indices, documents):
+                await write_outputs(index, document)
+    
+    await asyncio.gather(*(worker() for _ in range(max(1, args.concurrency))))
+    report(force=True)
+
+def run_batch_command(args):
+    """batch子命令：不經網頁直接以AIResumeGenerator離線大量生成文件"""
+    if not args.jsonl and not args.pdf_dir:
+        print("請至少指定 --jsonl 或 --pdf-dir 其中一種輸出", file=sys.stderr)
+        return 2
+    
+    data = load_json_file(args.params) if args.params else {}
+    for key, value in (('jobType', args.job_type), ('companyName', args.company_name),
+                       ('educationLevel', args.education_level), ('targetMajor', args.target_major),
+                       ('sectionParallel', args.section_parallel)):
+        if value is not None:
+            data[key] = value
+    traits = load_json_file(args.traits) if args.traits else data.get('personalityTraits')
+    
+    def params_for(index):
+        # 特質檔為清單時依文件索引輪流套用（批次內共用第一份的特質）
+        item = traits[index % len(traits)] if isinstance(traits, list) and traits else traits
+        return build_generation_params(dict(data, personalityTraits=item), args.type)
     
+    # 以JSON來回轉換一次，與讀回的記錄檔比較時格式一致
+    settings = json.loads(json.dumps({'type': args.type, 'params': data, 'traits': traits}, ensure_ascii=False))
+    if args.resume:
+        completed, missing_pdfs = read_batch_checkpoint(args.jsonl, args.pdf_dir)
+        error = check_batch_meta(args, settings, bool(completed or missing_pdfs))
+        if error:
+            print(f"[batch] {error}", file=sys.stderr)
+            return 2
+    else:
+        completed, missing_pdfs = set(), {}
+    pending = [i for i in range(args.count) if i not in completed]
+    missing_pdfs = {i: doc for i, doc in missing_pdfs.items() if i < args.count}
+    
+    generator = get_generator()
+    if args.rate_limit is not None or args.rate_burst is not None:
+        # 只指定其中一項時，另一項沿用環境變數的設定
+        generator.rate_limiter = TokenBucket(
+            GEMINI_RATE_LIMIT if args.rate_limit is None else args.rate_limit,
+            GEMINI_RATE_BURST if args.rate_burst is None else args.rate_burst
+        )
+    if args.pdf_dir:
+        os.makedirs(args.pdf_dir, exist_ok=True)
+    
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 32)
+    with open(batch_meta_path(args), 'w', encoding='utf-8') as f:
+        json.dump({'seed': args.seed, 'settings': settings}, f, ensure_ascii=False, indent=2)
+    print(
+        f"[batch] 種子 {args.seed}，共 {args.count} 份，已完成 {len(completed)} 份，待生成 {len(pending)} 份"
+        + (f"，待補PDF {len(missing_pdfs)} 份" if missing_pdfs else ""),
+        file=sys.stderr, flush=True
+    )
+    
+    jsonl_file = open(args.jsonl, 'a' if args.resume else 'w', encoding='utf-8') if args.jsonl else None
     try:
-        with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-            for i, document in enumerate(task['documents']):
-                doc_type_name = "履歷" if document['document_type'] == 'job_application' else "學習歷程"
-                pdf_filename = f"{doc_type_name}_{document['basic_info']['name']}_{i+1:03d}.pdf"
-                pdf_filepath = os.path.join(temp_dir, pdf_filename)
-                
-                generator.generate_pdf(document, pdf_filepath)
-                zipf.write(pdf_filepath, pdf_filename)
-                
-                # 清理臨時PDF檔案
-                os.remove(pdf_filepath)
-        
-        return send_file(zip_filepath, as_attachment=True, download_name=zip_filename)
-        
+        asyncio.run(run_batch(args, generator, params_for, pending, missing_pdfs, jsonl_file))
+    except KeyboardInterrupt:
+        print("[batch] 已中斷，可使用 --resume 從目前進度繼續", file=sys.stderr)
+        return 130
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+    return 0
+
+async def run_queued_job(job):
+    """在worker程序中執行佇列任務，並定期更新心跳；結束時回報結果"""
+    loop = asyncio.get_running_loop()
+    
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(JOB_LEASE_TIMEOUT / 3)
+            await loop.run_in_executor(None, get_job_queue().heartbeat, job['job_id'])
+    
+    beat = asyncio.ensure_future(heartbeat())
+    error = None
+    try:
+        await run_generation_task(job['task_id'], **job['payload'])
     except Exception as e:
-        return jsonify({'error': f'ZIP生成失敗: {str(e)}'}), 500
+        error = str(e)
+    finally:
+        beat.cancel()
+    await loop.run_in_executor(None, get_job_queue().finish, job['job_id'], error)
 
-if __name__ == '__main__':
-    # 創建templates目錄
-    if not os.path.exists('templates'):
-        os.makedirs('templates')
+async def job_worker_loop(worker_id):
+    """同時執行最多JOB_WORKER_TASKS個任務；同一個事件迴圈讓公平排程器在任務之間輪流分派"""
+    loop = asyncio.get_running_loop()
+    running = set()
+    while True:
+        if len(running) < max(1, JOB_WORKER_TASKS):
+            job = await loop.run_in_executor(None, get_job_queue().claim, worker_id)
+            if job is not None:
+                running.add(asyncio.ensure_future(run_queued_job(job)))
+                continue
+        if running:
+            _, running = await asyncio.wait(running, timeout=JOB_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+def job_worker_main(worker_id):
+    """worker程序：持續領取並執行佇列中的任務"""
+    print(f"[worker {worker_id}] 已啟動 (pid {os.getpid()})", file=sys.stderr, flush=True)
+    asyncio.run(job_worker_loop(worker_id))
+
+def run_worker_command(args):
+    """worker子命令：啟動並看顧執行佇列任務的worker程序"""
+    if JOB_QUEUE_BACKEND != 'sqlite':
+        print("請設定 JOB_QUEUE=sqlite，網頁程序才會將任務排入共用佇列", file=sys.stderr)
+        return 2
     
-    # 創建HTML模板
-    html_template = '''<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>AI履歷生成器 - 應徵資料與學習歷程</title>
-    <style>
-        body {
-            font-family: 'Microsoft JhengHei', Arial, sans-serif;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-        }
-        
-        .container {
-            background: white;
-            border-radius: 15px;
-            padding: 30px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-        }
-        
-        h1 {
-            text-align: center;
-            color: #333;
-            margin-bottom: 30px;
-            font-size: 2.2em;
-        }
-        
-        .controls {
-            background: #f8f9fa;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 30px;
-        }
-        
-        .control-group {
-            display: flex;
-            gap: 20px;
-            align-items: center;
-            margin-bottom: 15px;
-            flex-wrap: wrap;
-        }
-        
-        .control-section {
-            margin-bottom: 25px;
-            padding: 15px;
-            background: #fff;
-            border-radius: 8px;
-            border: 1px solid #e0e0e0;
-        }
-        
-        .control-section h3 {
-            margin-top: 0;
-            color: #667eea;
-            font-size: 1.1em;
-        }
-        
-        label {
-            font-weight: bold;
-            color: #555;
-            min-width: 120px;
-        }
-        
-        input, select {
-            padding: 8px 12px;
-            border: 2px solid #ddd;
-            border-radius: 5px;
-            font-size: 14px;
-        }
-        
-        .trait-group {
-            margin-bottom: 10px;
-        }
-        
-        .trait-options {
-            display: flex;
-            gap: 10px;
-            flex-wrap: wrap;
-            margin-top: 5px;
-        }
-        
-        .trait-option {
-            padding: 5px 12px;
-            background: #f0f0f0;
-            border: 1px solid #ddd;
-            border-radius: 15px;
-            cursor: pointer;
-            font-size: 12px;
-            transition: all 0.3s ease;
-        }
-        
-        .trait-option:hover {
-            background: #e0e0e0;
-        }
-        
-        .trait-option.selected {
-            background: #667eea;
-            color: white;
-        }
-        
-        .btn {
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            color: white;
-            border: none;
-            padding: 12px 30px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: bold;
-            transition: all 0.3s ease;
-            margin: 5px;
-        }
-        
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(0,0,0,0.2);
-        }
-        
-        .btn:disabled {
-            background: #ccc;
-            cursor: not-allowed;
-            transform: none;
-        }
-        
-        .document-type-toggle {
-            display: flex;
-            background: #f0f0f0;
-            border-radius: 25px;
-            padding: 5px;
-            margin-bottom: 20px;
-        }
-        
-        .document-type-option {
-            flex: 1;
-            padding: 10px 20px;
-            text-align: center;
-            cursor: pointer;
-            border-radius: 20px;
-            transition: all 0.3s ease;
-        }
-        
-        .document-type-option.active {
-            background: #667eea;
-            color: white;
-        }
-        
-        .progress-container {
-            display: none;
-            margin: 20px 0;
-        }
-        
-        .progress-bar {
-            width: 100%;
-            height: 20px;
-            background: #f0f0f0;
-            border-radius: 10px;
-            overflow: hidden;
-        }
-        
-        .progress-fill {
-            height: 100%;
-            background: linear-gradient(45deg, #667eea, #764ba2);
-            width: 0%;
-            transition: width 0.3s ease;
-        }
-        
-        .stats {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 15px;
-            margin: 20px 0;
-        }
-        
-        .stat-card {
-            background: white;
-            padding: 15px;
-            border-radius: 8px;
-            text-align: center;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        
-        .stat-number {
-            font-size: 2em;
-            font-weight: bold;
-            color: #667eea;
-        }
-        
-        .document-preview {
-            background: white;
-            padding: 20px;
-            border-radius: 8px;
-            margin: 10px 0;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        
-        .document-section {
-            margin: 15px 0;
-        }
-        
-        .document-section h3 {
-            color: #667eea;
-            border-bottom: 1px solid #eee;
-            padding-bottom: 5px;
-        }
-        
-        .hidden {
-            display: none;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🤖 AI履歷生成器 - 應徵資料與學習歷程</h1>
-        
-        <div class="controls">
-            <!-- 文件類型選擇 -->
-            <div class="document-type-toggle">
-                <div class="document-type-option active" data-type="job_application">
-                    💼 求職履歷
-                </div>
-                <div class="document-type-option" data-type="student_portfolio">
-                    🎓 學習歷程
-                </div>
-            </div>
-            
-            <!-- 基本設定 -->
-            <div class="control-section">
-                <h3>📋 基本設定</h3>
-                <div class="control-group">
-                    <label>生成數量：</label>
-                    <input type="number" id="documentCount" value="5" min="1" max="50">
-                </div>
-            </div>
-            
-            <!-- 求職履歷專用設定 -->
-            <div class="control-section" id="jobApplicationSettings">
-                <h3>💼 求職履歷設定</h3>
-                <div class="control-group">
-                    <label>職位類型：</label>
-                    <select id="jobType">
-                        <option value="software">軟體工程師</option>
-                        <option value="marketing">行銷專員</option>
-                        <option value="finance">財務分析師</option>
-                        <option value="hr">人力資源專員</option>
-                        <option value="design">UI/UX設計師</option>
-                        <option value="sales">業務代表</option>
-                    </select>
-                </div>
-                <div class="control-group">
-                    <label>公司名稱：</label>
-                    <input type="text" id="companyName" value="科技創新股份有限公司">
-                </div>
-                <div class="control-group">
-                    <label>教育程度：</label>
-                    <select id="educationLevel">
-                        <option value="學士">學士</option>
-                        <option value="碩士">碩士</option>
-                        <option value="博士">博士</option>
-                    </select>
-                </div>
-            </div>
-            
-            <!-- 學習歷程專用設定 -->
-            <div class="control-section hidden" id="studentPortfolioSettings">
-                <h3>🎓 學習歷程設定</h3>
-                <div class="control-group">
-                    <label>目標科系：</label>
-                    <select id="targetMajor">
-                        <option value="science">理學院 (物理、化學、生物)</option>
-                        <option value="engineering">工學院 (機械、電機、化工)</option>
-                        <option value="medical">醫學院 (醫學、牙醫、藥學)</option>
-                        <option value="business">商學院 (企管、會計、經濟)</option>
-                        <option value="liberal_arts">文學院 (中文、外語、歷史)</option>
-                        <option value="arts">藝術學院 (美術、音樂、設計)</option>
-                    </select>
-                </div>
-            </div>
-            
-            <!-- 個人特質設定 -->
-            <div class="control-section">
-                <h3>🎯 個人特質設定</h3>
-                <p style="color: #666; font-size: 14px;">選擇個人特質，或留空讓系統隨機選擇</p>
-                
-                {% for category, traits in personality_traits.items() %}
-                <div class="trait-group">
-                    <label>{{ category }}：</label>
-                    <div class="trait-options" data-category="{{ category }}">
-                        {% for trait in traits %}
-                        <div class="trait-option" data-trait="{{ trait }}">{{ trait }}</div>
-                        {% endfor %}
-                    </div>
-                </div>
-                {% endfor %}
-            </div>
-            
-            <!-- 操作按鈕 -->
-            <div class="control-group">
-                <button class="btn" onclick="startGeneration()">🚀 生成文件</button>
-                <button class="btn" onclick="downloadAllPDFs()" id="downloadBtn" disabled>📥 下載所有PDF</button>
-                <button class="btn" onclick="clearResults()">🗑️ 清除結果</button>
-                <button class="btn" onclick="randomizeTraits()" style="background: #28a745;">🎲 隨機特質</button>
-            </div>
-        </div>
-        
-        <div class="progress-container" id="progressContainer">
-            <div class="progress-bar">
-                <div class="progress-fill" id="progressFill"></div>
-            </div>
-            <p id="progressText">準備中...</p>
-        </div>
-        
-        <div class="stats" id="statsContainer" style="display: none;">
-            <div class="stat-card">
-                <div class="stat-number" id="totalCount">0</div>
-                <div class="stat-label">總文件數</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number" id="aiGenerated">0</div>
-                <div class="stat-label">AI生成數</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-number" id="avgLength">0</div>
-                <div class="stat-label">平均字數</div>
-            </div>
-        </div>
-        
-        <div id="previewArea" style="display: none;">
-            <h2>📋 生成的文件預覽</h2>
-            <div id="documentList"></div>
-        </div>
-    </div>
-
-    <script>
-        let currentTaskId = null;
-        let currentDocumentType = 'job_application';
-        
-        // 文件類型切換
-        document.querySelectorAll('.document-type-option').forEach(option => {
-            option.addEventListener('click', function() {
-                // 更新按鈕狀態
-                document.querySelectorAll('.document-type-option').forEach(o => o.classList.remove('active'));
-                this.classList.add('active');
-                
-                // 更新文件類型
-                currentDocumentType = this.dataset.type;
-                
-                // 顯示/隱藏相應設定
-                if (currentDocumentType === 'job_application') {
-                    document.getElementById('jobApplicationSettings').classList.remove('hidden');
-                    document.getElementById('studentPortfolioSettings').classList.add('hidden');
-                } else {
-                    document.getElementById('jobApplicationSettings').classList.add('hidden');
-                    document.getElementById('studentPortfolioSettings').classList.remove('hidden');
-                }
-            });
-        });
-        
-        // 特質選擇
-        document.querySelectorAll('.trait-option').forEach(option => {
-            option.addEventListener('click', function() {
-                const category = this.parentElement.dataset.category;
-                // 清除同類別的其他選擇
-                this.parentElement.querySelectorAll('.trait-option').forEach(o => o.classList.remove('selected'));
-                // 選擇當前選項
-                this.classList.add('selected');
-            });
-        });
-        
-        // 隨機選擇特質
-        function randomizeTraits() {
-            document.querySelectorAll('.trait-options').forEach(group => {
-                const options = group.querySelectorAll('.trait-option');
-                // 清除所有選擇
-                options.forEach(o => o.classList.remove('selected'));
-                // 隨機選擇一個
-                const randomOption = options[Math.floor(Math.random() * options.length)];
-                randomOption.classList.add('selected');
-            });
-        }
-        
-        // 獲取選擇的特質
-        function getSelectedTraits() {
-            const traits = {};
-            document.querySelectorAll('.trait-options').forEach(group => {
-                const category = group.dataset.category;
-                const selected = group.querySelector('.trait-option.selected');
-                if (selected) {
-                    traits[category] = selected.dataset.trait;
-                }
-            });
-            return Object.keys(traits).length > 0 ? traits : null;
-        }
-        
-        async function startGeneration() {
-            const count = parseInt(document.getElementById('documentCount').value);
-            
-            if (count < 1 || count > 50) {
-                alert('請輸入1-50之間的數量');
-                return;
-            }
-            
-            try {
-                // 準備請求數據
-                const requestData = {
-                    count: count,
-                    documentType: currentDocumentType,
-                    personalityTraits: getSelectedTraits()
-                };
-                
-                if (currentDocumentType === 'job_application') {
-                    requestData.jobType = document.getElementById('jobType').value;
-                    requestData.companyName = document.getElementById('companyName').value;
-                    requestData.educationLevel = document.getElementById('educationLevel').value;
-                } else {
-                    requestData.targetMajor = document.getElementById('targetMajor').value;
-                }
-                
-                // 發送生成請求
-                const response = await fetch('/generate', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(requestData)
-                });
-                
-                const result = await response.json();
-                
-                if (response.ok) {
-                    currentTaskId = result.task_id;
-                    startProgressTracking();
-                } else {
-                    alert('錯誤: ' + result.error);
-                }
-                
-            } catch (error) {
-                alert('請求失敗: ' + error.message);
-            }
-        }
-        
-        function startProgressTracking() {
-            document.getElementById('progressContainer').style.display = 'block';
-            document.getElementById('previewArea').style.display = 'none';
-            document.getElementById('statsContainer').style.display = 'none';
-            
-            const interval = setInterval(async () => {
-                try {
-                    const response = await fetch(`/progress/${currentTaskId}`);
-                    const progress = await response.json();
-                    
-                    if (response.ok) {
-                        const percentage = (progress.progress / progress.total) * 100;
-                        document.getElementById('progressFill').style.width = percentage + '%';
-                        document.getElementById('progressText').textContent = progress.message;
-                        
-                        if (progress.status === 'completed') {
-                            clearInterval(interval);
-                            document.getElementById('progressContainer').style.display = 'none';
-                            loadResults();
-                        } else if (progress.status === 'error') {
-                            clearInterval(interval);
-                            alert('生成錯誤: ' + progress.message);
-                            document.getElementById('progressContainer').style.display = 'none';
-                        }
-                    }
-                } catch (error) {
-                    clearInterval(interval);
-                    alert('進度查詢失敗: ' + error.message);
-                }
-            }, 1000);
-        }
-        
-        async function loadResults() {
-            try {
-                // 載入文件列表
-                const documentsResponse = await fetch(`/documents/${currentTaskId}`);
-                const documentsData = await documentsResponse.json();
-                
-                if (documentsResponse.ok) {
-                    displayDocuments(documentsData.documents);
-                }
-                
-                document.getElementById('downloadBtn').disabled = false;
-                
-            } catch (error) {
-                alert('載入結果失敗: ' + error.message);
-            }
-        }
-        
-        function displayDocuments(documents) {
-            const previewArea = document.getElementById('previewArea');
-            const documentList = document.getElementById('documentList');
-            
-            previewArea.style.display = 'block';
-            documentList.innerHTML = '';
-            
-            // 更新統計
-            document.getElementById('statsContainer').style.display = 'grid';
-            document.getElementById('totalCount').textContent = documents.length;
-            document.getElementById('aiGenerated').textContent = documents.length;
-            
-            documents.forEach((document, index) => {
-                const documentDiv = window.document.createElement('div');
-                documentDiv.className = 'document-preview';
-                
-                const basicInfo = document.basic_info;
-                const content = document.content;
-                const traits = document.personality_traits;
-                const docType = document.document_type;
-                
-                const traitsHTML = Object.entries(traits).map(([key, value]) => 
-                    `${key}: ${value}`
-                ).join(' | ');
-                
-                documentDiv.innerHTML = `
-                    <div class="document-header">
-                        <h2>${basicInfo.name} ${docType === 'job_application' ? '(求職履歷)' : '(學習歷程)'}</h2>
-                        <p><strong>聯絡資訊：</strong>${basicInfo.email} | ${basicInfo.phone} | ${basicInfo.city} | ${basicInfo.age}歲</p>
-                        <p><strong>個人特質：</strong>${traitsHTML}</p>
-                    </div>
-                    
-                    ${Object.entries(content).map(([key, value]) => {
-                        const sectionTitles = {
-                            'education': '🎓 學歷背景/學業表現',
-                            'language_skills': '🌍 語言能力',
-                            'experience': '💼 工作經驗/課外活動',
-                            'technical_skills': '🛠️ 專業技能/競賽經驗',
-                            'certificates': '🏆 證照資格/志工服務',
-                            'projects': '🚀 專案經驗/專題研究',
-                            'personality': '👤 個人特質描述',
-                            'vision': '🎯 願景/學習動機'
-                        };
-                        
-                        return `
-                            <div class="document-section">
-                                <h3>${sectionTitles[key] || key}</h3>
-                                <p>${value.replace(/\\n/g, '<br>')}</p>
-                            </div>
-                        `;
-                    }).join('')}
-                    
-                    <button class="btn" onclick="downloadSinglePDF(${index})">下載此文件PDF</button>
-                `;
-                
-                documentList.appendChild(documentDiv);
-            });
-        }
-        
-        function downloadSinglePDF(index) {
-            if (!currentTaskId) {
-                alert('請先生成文件');
-                return;
-            }
-            
-            window.open(`/download/${currentTaskId}/${index}`, '_blank');
-        }
-        
-        function downloadAllPDFs() {
-            if (!currentTaskId) {
-                alert('請先生成文件');
-                return;
-            }
-            
-            window.open(`/download_all/${currentTaskId}`, '_blank');
-        }
-        
-        function clearResults() {
-            currentTaskId = null;
-            document.getElementById('previewArea').style.display = 'none';
-            document.getElementById('statsContainer').style.display = 'none';
-            document.getElementById('progressContainer').style.display = 'none';
-            document.getElementById('downloadBtn').disabled = true;
-            document.getElementById('documentList').innerHTML = '';
-        }
-    </script>
-</body>
-</html>'''
+    # 以spawn啟動，避免子程序繼承父程序的SQLite連線
+    context = multiprocessing.get_context('spawn')
+    processes = {}
     
-    # 寫入HTML模板
-    with open('templates/index.html', 'w', encoding='utf-8') as f:
-        f.write(html_template)
+    def start(slot):
+        process = context.Process(target=job_worker_main, args=(f'{os.getpid()}-{slot}',))
+        process.start()
+        processes[slot] = process
     
+    for slot in range(max(1, args.processes)):
+        start(slot)
+    try:
+        while True:
+            time.sleep(1)
+            for slot, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"[worker] 程序 {process.pid} 已結束（代碼 {process.exitcode}），重新啟動", file=sys.stderr)
+                    start(slot)
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+    return 0
+
+def serve():
+    """啟動Flask開發伺服器"""
     print("🤖 AI履歷生成器啟動中...")
     print("📁 請安裝依賴: pip install flask reportlab google-generativeai")
     print("🔑 請設定 GEMINI_API_KEY 環境變數以啟用AI生成功能")
     print("🌐 網站將在 http://127.0.0.1:5000 啟動")
     
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    app = create_app()
+    # 預先在背景載入字體，不阻塞啟動
+    get_pdf_render_context().load_fonts_in_background()
+    app.run(debug=True, host='127.0.0.1', port=5000)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AI履歷生成器')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('serve', help='啟動網頁伺服器（預設）')
+    
+    batch = subparsers.add_parser('batch', help='不經網頁離線大量生成文件')
+    batch.add_argument('--count', type=int, required=True, help='生成文件的數量')
+    batch.add_argument('--type', choices=['job_application', 'student_portfolio'], default='job_application',
+                       help='文件類型')
+    batch.add_argument('--params', help='生成參數JSON檔，鍵名與 /generate 請求相同（jobType、companyName等）')
+    batch.add_argument('--job-type', help='應徵職位類別')
+    batch.add_argument('--company-name', help='目標公司')
+    batch.add_argument('--education-level', help='教育程度')
+    batch.add_argument('--target-major', help='學習歷程的目標科系類別')
+    batch.add_argument('--section-parallel', action='store_true', default=None,
+                       help='將八個區段拆成並行的小請求（覆寫 SECTION_PARALLEL）')
+    batch.add_argument('--traits', help='個人特質JSON檔：物件套用到所有文件，清單則依序輪流套用')
+    batch.add_argument('--seed', type=int, help='亂數種子，相同種子與參數會產生相同的備用內容與提示（預設隨機並輸出到stderr）')
+    batch.add_argument('--concurrency', type=int, default=GENERATION_CONCURRENCY, help='同時生成的工作數')
+    batch.add_argument('--batch-size', type=int, default=GEMINI_BATCH_SIZE,
+                       help=f'每次Gemini請求生成的文件數（1-{GEMINI_MAX_BATCH_SIZE}）')
+    batch.add_argument('--rate-limit', type=float, help='每秒Gemini請求數，覆寫 GEMINI_RATE_LIMIT（0表示不限制）')
+    batch.add_argument('--rate-burst', type=int, help='令牌桶容量，覆寫 GEMINI_RATE_BURST')
+    batch.add_argument('--jsonl', help='將文件逐行寫入此JSONL檔')
+    batch.add_argument('--pdf-dir', help='將每份文件的PDF寫入此目錄')
+    batch.add_argument('--resume', action='store_true', help='依既有輸出跳過已完成的文件繼續生成')
+    batch.add_argument('--progress-interval', type=float, default=2.0, help='進度輸出到stderr的間隔秒數')
+    
+    worker = subparsers.add_parser('worker', help='啟動執行任務佇列的worker程序（需設定 JOB_QUEUE=sqlite）')
+    worker.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='worker程序數')
+    
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        return run_worker_command(args)
+    if args.command == 'batch':
+        if not 1 <= args.batch_size <= GEMINI_MAX_BATCH_SIZE:
+            parser.error(f'--batch-size 需介於1-{GEMINI_MAX_BATCH_SIZE}之間')
+        return run_batch_command(args)
+    serve()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""AdaptiveLimiter 的回歸測試"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+def test_cancelled_waiter_does_not_swallow_slot():
+    """尚未被喚醒就取消的等待者，不可吃掉下一個等待者的名額"""
+    async def scenario():
+        limiter = rg.AdaptiveLimiter(1, 1, 1)
+        acquired_at = await limiter.acquire_async()
+        first = asyncio.ensure_future(limiter.acquire_async())
+        second = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        limiter.release(acquired_at, 'success')
+        await asyncio.wait_for(second, 1)
+        assert limiter.in_flight == 1
+        assert not limiter.async_waiters
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_wakeup_passes_slot_on():
+    """被喚醒後才取消的等待者，要把名額讓給下一個等待者"""
+    async def scenario():
+        limiter = rg.AdaptiveLimiter(1, 1, 1)
+        acquired_at = await limiter.acquire_async()
+        first = asyncio.ensure_future(limiter.acquire_async())
+        second = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0)
+        limiter.release(acquired_at, 'success')
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_window_shrinks_on_overload_and_grows_when_saturated():
+    limiter = rg.AdaptiveLimiter(4, 1, 8, decrease_factor=0.5)
+    acquired = [limiter.acquire() for _ in range(4)]
+    limiter.release(acquired[0], 'overload')
+    assert limiter.window == 2
+    # 同一批在縮小前送出的請求不重複縮小
+    limiter.release(acquired[1], 'overload')
+    assert limiter.window == 2
+    for acquired_at in acquired[2:]:
+        limiter.release(acquired_at, 'success')
+    held = [limiter.acquire() for _ in range(2)]
+    limiter.release(held[0], 'success')
+    assert limiter.limit > 2
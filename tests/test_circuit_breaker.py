@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""CircuitBreaker 試探請求的回歸測試"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+class HangingModel:
+    """永遠不回應的模型，用來讓試探請求停在進行中"""
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(3600)
+
+
+def half_open_breaker():
+    breaker = rg.CircuitBreaker(1, 0, probe_timeout=3600)
+    breaker.record_failure()
+    return breaker
+
+
+def test_cancelled_probe_lets_next_request_probe():
+    generator = rg.AIResumeGenerator(enable_gemini=False)
+    generator.model = HangingModel()
+    generator.gemini_available = True
+    generator.response_cache = None
+    generator.circuit_breaker = half_open_breaker()
+    
+    async def scenario():
+        probe = asyncio.ensure_future(generator.generate_with_gemini_async('試探請求'))
+        await asyncio.sleep(0.05)
+        assert generator.circuit_breaker.probe_in_flight
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+    
+    asyncio.run(scenario())
+    assert generator.circuit_breaker.allow_request()
+
+
+def test_stale_probe_expires():
+    breaker = half_open_breaker()
+    breaker.probe_timeout = 0
+    assert breaker.allow_request()
+    # 試探請求沒有回報結果，超過probe_timeout後放行新的試探
+    assert breaker.allow_request()
+
+
+def test_only_one_probe_while_half_open():
+    breaker = half_open_breaker()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == rg.CircuitBreaker.CLOSED
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""SQLiteJobQueue 的回歸測試"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+@pytest.fixture
+def task_store(monkeypatch):
+    store = rg.InMemoryTaskStore()
+    monkeypatch.setattr(rg, '_task_store', store)
+    return store
+
+
+def expire_lease(queue, job_id):
+    """模擬worker中斷：心跳停在租約時間之前"""
+    db = queue.connect()
+    with db:
+        db.execute('UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?', (time.time() - queue.lease_timeout - 1, job_id))
+
+
+def job_row(queue, job_id):
+    return queue.connect().execute('SELECT status, attempts, worker FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+
+
+def test_claim_prefers_higher_priority(tmp_path):
+    queue = rg.SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    queue.enqueue('first', {'count': 50, 'priority': 1})
+    queue.enqueue('urgent', {'count': 2, 'priority': 5})
+    queue.enqueue('second', {'count': 2})
+    
+    claimed = [queue.claim('worker')['task_id'] for _ in range(3)]
+    assert claimed == ['urgent', 'first', 'second']
+    assert queue.claim('worker') is None
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = rg.SQLiteJobQueue(str(tmp_path / 'jobs.db'), lease_timeout=60)
+    queue.enqueue('task', {'count': 1})
+    job = queue.claim('worker-1')
+    queue.heartbeat(job['job_id'])
+    
+    assert queue.claim('worker-2') is None
+    queue.finish(job['job_id'])
+    assert job_row(queue, job['job_id'])[0] == 'done'
+    assert queue.backlog() == 0
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    queue = rg.SQLiteJobQueue(str(tmp_path / 'jobs.db'), lease_timeout=60)
+    queue.enqueue('task', {'count': 1})
+    job = queue.claim('worker-1')
+    expire_lease(queue, job['job_id'])
+    
+    reclaimed = queue.claim('worker-2')
+    assert reclaimed == job
+    assert job_row(queue, job['job_id']) == ('running', 2, 'worker-2')
+
+
+def test_job_fails_after_max_attempts(tmp_path, task_store):
+    queue = rg.SQLiteJobQueue(str(tmp_path / 'jobs.db'), lease_timeout=60)
+    task_store.create_task('task', 1)
+    queue.enqueue('task', {'count': 1})
+    for attempt in range(rg.JOB_MAX_ATTEMPTS):
+        job = queue.claim(f'worker-{attempt}')
+        assert job is not None
+        expire_lease(queue, job['job_id'])
+    
+    assert queue.claim('worker-last') is None
+    assert job_row(queue, job['job_id'])[:2] == ('failed', rg.JOB_MAX_ATTEMPTS)
+    assert task_store.get_task('task')['status'] == 'error'
+
+
+def test_full_queue_rejects_with_503(tmp_path, monkeypatch, task_store):
+    queue = rg.SQLiteJobQueue(str(tmp_path / 'jobs.db'), max_backlog=1)
+    queue.enqueue('running', {'count': 1})
+    with pytest.raises(rg.QueueFullError):
+        queue.enqueue('overflow', {'count': 1})
+    monkeypatch.setattr(rg, '_job_queue', queue)
+    
+    client = rg.create_app({'TESTING': True}).test_client()
+    response = client.post('/generate', json={'count': 1})
+    
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    assert task_store.stats()['tasks'] == 0
+    assert queue.backlog() == 1
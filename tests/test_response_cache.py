@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Gemini回應快取檔案的清除與容量上限"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+def disk_rows(cache):
+    if cache.gc_thread is not None:
+        cache.gc_thread.join()
+    return cache.connect().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+def test_disk_cache_evicts_oldest_rows_over_budget(tmp_path):
+    cache = rg.ResponseCache(1 << 20, 0, str(tmp_path / 'cache.db'), disk_max_bytes=1000)
+    for i in range(20):
+        cache.set(f'prompt {i}', 'model', 'x' * 100)
+    disk_rows(cache)
+    cache.gc()
+    
+    assert cache.disk_bytes <= 1000
+    assert disk_rows(cache) <= 10
+    # 最新寫入的回應保留，最早的已從檔案刪除
+    cache.memory.clear()
+    assert cache.get('prompt 19', 'model') == 'x' * 100
+    assert cache.get('prompt 0', 'model') is None
+
+
+def test_disk_cache_removes_expired_rows(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = rg.ResponseCache(1 << 20, 0.01, path)
+    cache.set('old', 'model', 'value')
+    time.sleep(0.05)
+    
+    # 開啟時在背景執行緒清除過期的回應
+    reopened = rg.ResponseCache(1 << 20, 0.01, path)
+    assert disk_rows(reopened) == 0
+    assert reopened.disk_bytes == 0
+
+
+def test_async_lookups_run_off_the_event_loop(tmp_path):
+    """有快取檔案時，事件迴圈上的查詢與寫入改在執行緒中進行"""
+    generator = rg.AIResumeGenerator(enable_gemini=False)
+    generator.response_cache = rg.ResponseCache(1 << 20, 0, str(tmp_path / 'cache.db'))
+    loop_thread = []
+    original_get = generator.response_cache.get
+    
+    def get(prompt, model_name):
+        loop_thread.append(rg.threading.current_thread() is rg.threading.main_thread())
+        return original_get(prompt, model_name)
+    generator.response_cache.get = get
+    
+    async def scenario():
+        await generator.cache_response_async('提示', '回應')
+        return await generator.get_cached_response_async('提示')
+    
+    assert rg.asyncio.run(scenario()) == '回應'
+    assert loop_thread == [False]
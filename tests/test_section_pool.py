@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""SectionPool 的回歸測試"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+class CountingModel:
+    """每次呼叫回傳不同版本的模型"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return type('Response', (), {'text': json.dumps([f'版本{self.calls}'], ensure_ascii=False)})()
+
+
+def test_key_locks_released_after_load():
+    pool = rg.SectionPool(1, 1 << 20)
+    for company in ('甲公司', '乙公司', '丙公司'):
+        assert pool.load(company, lambda: ['版本']) == ['版本']
+    assert pool.key_locks == {}
+
+
+def test_expired_pool_is_sampled_again_despite_response_cache():
+    generator = rg.AIResumeGenerator(enable_gemini=False)
+    generator.model = CountingModel()
+    generator.gemini_available = True
+    generator.response_cache = rg.ResponseCache(1 << 20)
+    generator.section_pool = rg.SectionPool(1, 1 << 20)
+    prepared = generator.prepare_document('job_application', {})
+    
+    generator.load_pools([prepared])
+    first = prepared['pooled']
+    # 模擬SECTION_POOL_TTL到期
+    generator.section_pool.cache.clear()
+    prepared = generator.prepare_document('job_application', {})
+    generator.load_pools([prepared])
+    
+    assert generator.model.calls == 2
+    assert prepared['pooled'] != first
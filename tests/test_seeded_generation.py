@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""同一個種子產生的任務文件，需與直接以 document_rng 生成的文件相同"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rg, '_generator', rg.AIResumeGenerator(enable_gemini=False))
+    return rg.create_app({'TESTING': True}).test_client()
+
+
+def wait_for_task(client, task_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        task = client.get(f'/progress/{task_id}').get_json()
+        if task['status'] not in rg.ACTIVE_STATUSES:
+            return task
+        time.sleep(0.05)
+    raise AssertionError(f'任務 {task_id} 沒有在 {timeout} 秒內完成')
+
+
+# none：保存生成時的文件；fallback：只存來源標記，讀取時依種子重新產生
+@pytest.mark.parametrize('lazy', ['none', 'fallback'])
+@pytest.mark.parametrize('document_type', ['job_application', 'student_portfolio'])
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_documents_match_direct_generation(client, monkeypatch, lazy, document_type, batch_size):
+    monkeypatch.setattr(rg, 'LAZY_DOCUMENTS', lazy)
+    seed = 20241017
+    count = 5
+    response = client.post('/generate', json={
+        'count': count, 'documentType': document_type, 'batchSize': batch_size, 'seed': seed
+    })
+    assert response.status_code == 200
+    task_id = response.get_json()['task_id']
+    assert wait_for_task(client, task_id)['status'] == 'completed'
+    
+    documents = client.get(f'/documents/{task_id}').get_json()['documents']
+    params = rg.get_task_store().get_task(task_id)['params']
+    generator = rg.get_generator()
+    expected = [generator.generate_document(document_type, params, rg.document_rng(seed, i)) for i in range(count)]
+    
+    assert [document['index'] for document in documents] == list(range(count))
+    for document, direct in zip(documents, expected):
+        for key in ('basic_info', 'personality_traits', 'content', 'document_type', 'source'):
+            assert document[key] == direct[key]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""/stream 事件格式的回歸測試"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+def read_stream(task_id):
+    client = rg.create_app({'TESTING': True}).test_client()
+    return client.get(f'/stream/{task_id}').get_data(as_text=True)
+
+
+def test_failed_task_does_not_use_builtin_error_event():
+    rg.get_task_store().create_task('stream-failed', 1)
+    rg.get_task_store().update_task('stream-failed', status='error', message='生成失敗')
+    
+    body = read_stream('stream-failed')
+    
+    assert 'event: failed\n' in body
+    assert 'event: error\n' not in body
+
+
+def test_documents_carry_event_ids():
+    rg.get_task_store().create_task('stream-done', 2)
+    rg.get_task_store().set_documents('stream-done', 0, [{'content': {}}, {'content': {}}])
+    rg.get_task_store().update_task('stream-done', status='completed')
+    
+    body = read_stream('stream-done')
+    
+    assert 'id: 0\nevent: document\n' in body
+    assert 'id: 1\nevent: document\n' in body
+    assert body.rstrip().split('\n\n')[-1].startswith('event: done')
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""任務儲存的回歸測試"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resume_generator as rg
+
+
+def test_cancelled_tasks_spill_when_over_budget(tmp_path):
+    """取消的任務保留文件，超過記憶體預算時也要能寫出到磁碟"""
+    store = rg.InMemoryTaskStore(memory_budget=100, spill_dir=str(tmp_path))
+    document = {'content': 'x' * 80}
+    for task_id, status in (('done', 'completed'), ('stopped', 'cancelled'), ('latest', 'completed')):
+        store.create_task(task_id, 1)
+        store.set_documents(task_id, 0, [document])
+        store.update_task(task_id, status=status)
+    
+    assert store.stats()['spilled_tasks'] == 2
+    assert store.resident_bytes() <= 100
+    assert store.get_document('stopped', 0) == document
+
+
+def test_stale_spill_files_removed_on_start(tmp_path):
+    """記憶體任務不跨程序保留，已結束程序留下的寫出檔要在啟動時刪除"""
+    legacy = tmp_path / 'old-task.jsonl.gz'
+    legacy.write_bytes(b'')
+    stale = tmp_path / '999999999'
+    stale.mkdir()
+    (stale / 'task.jsonl.gz').write_bytes(b'')
+    live = tmp_path / str(os.getppid())
+    live.mkdir()
+    
+    store = rg.InMemoryTaskStore(memory_budget=100, spill_dir=str(tmp_path))
+    
+    assert not legacy.exists()
+    assert not stale.exists()
+    assert live.exists()
+    assert store.spill_dir == str(tmp_path / str(os.getpid()))
+
+
+def test_store_stats_have_the_same_shape(tmp_path):
+    memory = rg.InMemoryTaskStore()
+    sqlite_store = rg.SQLiteTaskStore(str(tmp_path / 'tasks.db'))
+    sqlite_store.create_task('task', 1)
+    sqlite_store.set_documents('task', 0, [{'content': 'x'}])
+    
+    stats = sqlite_store.stats()
+    assert set(stats) == set(memory.stats())
+    assert stats['stored_bytes'] > 0
+    assert stats['spilled_bytes'] == 0